@@ -1,22 +1,33 @@
 import streamlit as st
-import requests
+import httpx
+import re
 import xml.etree.ElementTree as ET
 import asyncio
-import sys
+import hashlib
+import logging
+import queue
 import os
 import io
-from io import StringIO
-import time
 import threading
+import contextvars
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.config import OPENAI_API_KEY, LLAMA_CLOUD_API_KEY
+from src.openai_clients import create_llm
+from src.disk_cache import cache_path, is_fresh, read_json, write_json, touch, read_bytes, write_bytes
 
 # Import the research generator module
 from main import initialize_research_pipeline, list_pdf_files, generate_outline_from_query
 
-def fetch_arxiv_papers(query, max_results=3):
-    base_url = "http://export.arxiv.org/api/query"
-    params = {
+# Set API keys once at import; keys already present in the environment win
+for _key_name, _key_value in (("OPENAI_API_KEY", OPENAI_API_KEY), ("LLAMA_CLOUD_API_KEY", LLAMA_CLOUD_API_KEY)):
+    if _key_value:
+        os.environ.setdefault(_key_name, _key_value)
+
+ARXIV_API_URL = "http://export.arxiv.org/api/query"
+
+def arxiv_query_params(query, max_results):
+    return {
         "search_query": query,
         "start": 0,
         "max_results": max_results,
@@ -24,73 +35,277 @@ def fetch_arxiv_papers(query, max_results=3):
         "sortOrder": "descending"
     }
 
-    response = requests.get(base_url, params=params)
+# Precomputed Atom qualified names for feed parsing
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+ATOM_ENTRY = f"{ATOM_NS}entry"
+ATOM_TITLE = f"{ATOM_NS}title"
+ATOM_PDF_LINK = f"{ATOM_NS}link[@title='pdf']"
+
+# Stream-parse an arxiv Atom feed into a list of {"title", "pdf_link"} dicts
+def parse_arxiv_feed(feed_bytes):
+    papers = []
+    for _, elem in ET.iterparse(io.BytesIO(feed_bytes), events=("end",)):
+        if elem.tag != ATOM_ENTRY:
+            continue
+        title = elem.find(ATOM_TITLE).text
+        pdf_link = elem.find(ATOM_PDF_LINK).attrib["href"]
+        papers.append({"title": title, "pdf_link": pdf_link})
+        # Release the finished entry's subtree
+        elem.clear()
+    return papers
+
+# Shared HTTP settings: HTTP/2 multiplexing, pooled keep-alive connections, and
+# redirect following (arxiv PDF links redirect from http to https)
+HTTP_CLIENT_OPTIONS = {
+    "http2": True,
+    "timeout": 30.0,
+    "follow_redirects": True,
+    "headers": {"User-Agent": "rp-gen"},
+    "limits": httpx.Limits(max_keepalive_connections=16),
+}
+
+# Pool TCP/TLS connections to arxiv.org across papers and reruns
+@st.cache_resource
+def get_http_client():
+    return httpx.Client(**HTTP_CLIENT_OPTIONS)
+
+# ArXiv results are persisted on disk for a day and revalidated with ETags after that
+ARXIV_CACHE_TTL = 24 * 60 * 60
+
+def arxiv_cache_path(query, max_results):
+    key = hashlib.blake2b(f"{query}|{max_results}".encode(), digest_size=16).hexdigest()
+    return cache_path("arxiv", key)
+
+# Send If-None-Match for a stale cache entry so an unchanged feed costs a 304
+def arxiv_revalidation_headers(cached):
+    if cached and cached.get("etag"):
+        return {"If-None-Match": cached["etag"]}
+    return {}
+
+# Downloaded PDFs are persisted on disk by URL so repeat fetches skip the network
+def pdf_cache_path(url):
+    key = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    return cache_path("pdf", key, suffix=".pdf")
+
+# Resolve papers from an arxiv response, reusing and refreshing the disk cache
+def papers_from_arxiv_response(response, path, cached):
+    if response.status_code == 304 and cached:
+        touch(path)
+        return cached["papers"]
     if response.status_code == 200:
-        root = ET.fromstring(response.text)
-        papers = []
-        for entry in root.findall("{http://www.w3.org/2005/Atom}entry"):
-            title = entry.find("{http://www.w3.org/2005/Atom}title").text
-            pdf_link = entry.find("{http://www.w3.org/2005/Atom}link[@title='pdf']").attrib["href"]
-            papers.append({"title": title, "pdf_link": pdf_link})
+        papers = parse_arxiv_feed(response.content)
+        write_json(path, {"papers": papers, "etag": response.headers.get("ETag")})
         return papers
-    return []
-
-# Function to run async code in a thread and capture output
-def run_async_in_thread(coro):
-    # Create a StringIO object to capture prints
-    captured_output = StringIO()
-    original_stdout = sys.stdout
-    sys.stdout = captured_output
-    
+    return cached["papers"] if cached else []
+
+# st.cache_data hands back a fresh deserialized copy on every hit, so callers
+# can safely mutate the returned list of paper dicts
+@st.cache_data(ttl="1h", max_entries=128)
+def fetch_arxiv_papers(query, max_results=3):
+    path = arxiv_cache_path(query, max_results)
+    cached = read_json(path)
+    if cached and is_fresh(path, ARXIV_CACHE_TTL):
+        return cached["papers"]
+
+    response = get_http_client().get(
+        ARXIV_API_URL,
+        params=arxiv_query_params(query, max_results),
+        headers=arxiv_revalidation_headers(cached)
+    )
+    return papers_from_arxiv_response(response, path, cached)
+
+# Fetch search results and all their PDFs over a single HTTP/2 connection pool
+async def fetch_all(query, max_results=3):
+    path = arxiv_cache_path(query, max_results)
+    cached = read_json(path)
+
+    async with httpx.AsyncClient(**HTTP_CLIENT_OPTIONS) as client:
+        if cached and is_fresh(path, ARXIV_CACHE_TTL):
+            papers = cached["papers"]
+        else:
+            response = await client.get(
+                ARXIV_API_URL,
+                params=arxiv_query_params(query, max_results),
+                headers=arxiv_revalidation_headers(cached)
+            )
+            papers = papers_from_arxiv_response(response, path, cached)
+
+        async def download(paper):
+            pdf_path = pdf_cache_path(paper["pdf_link"])
+            content = await asyncio.to_thread(read_bytes, pdf_path)
+            if content is not None:
+                return content
+            pdf_response = await client.get(paper["pdf_link"])
+            pdf_response.raise_for_status()
+            await asyncio.to_thread(write_bytes, pdf_path, pdf_response.content)
+            return pdf_response.content
+
+        # Download every PDF concurrently; failed downloads come back as exceptions
+        results = await asyncio.gather(*(download(paper) for paper in papers), return_exceptions=True)
+
+    pdfs = {
+        paper["title"]: result
+        for paper, result in zip(papers, results)
+        if not isinstance(result, BaseException)
+    }
+    return papers, pdfs
+
+# Download a PDF once per URL; bytes (not BytesIO) keep the cached value immutable
+@st.cache_data(ttl="1h", max_entries=128)
+def download_pdf_bytes(url):
+    path = pdf_cache_path(url)
+    content = read_bytes(path)
+    if content is not None:
+        return content
+    response = get_http_client().get(url)
+    # Raise instead of returning None so failed downloads are not cached
+    response.raise_for_status()
+    write_bytes(path, response.content)
+    return response.content
+
+# Share one LLM client across reruns instead of rebuilding it per click
+@st.cache_resource
+def get_llm(model, temperature):
+    return create_llm(api_key=OPENAI_API_KEY, model=model, temperature=temperature)
+
+# Download all paper PDFs concurrently, returning {title: bytes}
+def download_papers_concurrently(papers):
+    pdfs = {}
+    if not papers:
+        return pdfs
+
+    with ThreadPoolExecutor(max_workers=min(8, len(papers))) as executor:
+        futures = {executor.submit(download_pdf_bytes, paper["pdf_link"]): paper for paper in papers}
+        for future in as_completed(futures):
+            try:
+                pdf_bytes = future.result()
+            except httpx.HTTPError:
+                # Skip papers whose download failed
+                continue
+            pdfs[futures[future]["title"]] = pdf_bytes
+    return pdfs
+
+# Run one long-lived event loop on a daemon thread, shared across reruns
+@st.cache_resource
+def get_bg_loop():
     loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(coro)
-    loop.close()
-    
-    # Restore stdout
-    sys.stdout = original_stdout
-    return result, captured_output.getvalue()
-
-# Function to display progress and logs
-def display_logs_and_progress(progress_bar, status_text, log_container, stop_event, stages):
-    progress_value = 0
-    stage_index = 0
-    while not stop_event.is_set() and stage_index < len(stages):
-        # Update status text
-        status_text.text(stages[stage_index])
-        
-        # Update progress based on current stage
-        progress_step = 1.0 / len(stages)
-        target_progress = (stage_index + 1) * progress_step
-        
-        # Smooth progress animation
-        while progress_value < target_progress and not stop_event.is_set():
-            progress_value = min(progress_value + 0.01, target_progress)
-            progress_bar.progress(progress_value)
-            time.sleep(0.1)
-        
-        stage_index += 1
-        
-        # Add some randomness to make it feel natural
-        if stage_index < len(stages):
-            time.sleep(1 + stage_index * 0.3)
-    
-    # Ensure we reach 100% when done
-    if not stop_event.is_set():
-        progress_bar.progress(1.0)
-        status_text.text("Process completed successfully!")
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+# Loggers used by the research pipeline; their records are streamed to the UI
+PIPELINE_LOGGERS = ("main", "src")
+for _logger_name in PIPELINE_LOGGERS:
+    logging.getLogger(_logger_name).setLevel(logging.INFO)
+
+# Identifies the run that owns the current task; tasks and to_thread calls inherit it
+_pipeline_run_id = contextvars.ContextVar("pipeline_run_id", default=None)
+
+# Logging handler that forwards formatted records into a queue, keeping only
+# records logged from within its own run so concurrent sessions don't mix logs
+class QueueLogHandler(logging.Handler):
+    def __init__(self, log_queue, wake_event, run_id):
+        super().__init__()
+        self.log_queue = log_queue
+        self.wake_event = wake_event
+        self.addFilter(lambda record: _pipeline_run_id.get() is run_id)
+
+    def emit(self, record):
+        self.log_queue.put_nowait(self.format(record))
+        self.wake_event.set()
+
+# Function to run async code on the background loop and stream its logs
+def run_async_in_thread(coro, log_output=None, stage_reporter=None):
+    # Set whenever there is a new log line, a new stage, or the coroutine finishes
+    wake_event = stage_reporter.wake_event if stage_reporter is not None else threading.Event()
+    log_queue = queue.Queue()
+    run_id = object()
+    handler = QueueLogHandler(log_queue, wake_event, run_id)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    for name in PIPELINE_LOGGERS:
+        logging.getLogger(name).addHandler(handler)
+
+    log_lines = []
+
+    def drain_logs():
+        drained = False
+        while True:
+            try:
+                log_lines.append(log_queue.get_nowait())
+            except queue.Empty:
+                return drained
+            drained = True
+
+    # Tag the run's task so the handler can tell its records apart
+    async def run_tagged():
+        _pipeline_run_id.set(run_id)
+        return await coro
+
+    try:
+        future = asyncio.run_coroutine_threadsafe(run_tagged(), get_bg_loop())
+        future.add_done_callback(lambda _: wake_event.set())
+        while not future.done():
+            # Sleep until the worker signals new output instead of polling
+            wake_event.wait()
+            wake_event.clear()
+            if drain_logs() and log_output is not None:
+                log_output.code("\n".join(log_lines), language="")
+            if stage_reporter is not None:
+                stage_reporter.flush()
+        result = future.result()
+    finally:
+        for name in PIPELINE_LOGGERS:
+            logging.getLogger(name).removeHandler(handler)
+        drain_logs()
+        if stage_reporter is not None:
+            stage_reporter.flush()
+    return result, "\n".join(log_lines)
+
+# Stages reported by initialize_research_pipeline, in order
+CONTENT_STAGES = (
+    "Generating outline...",
+    "Creating pipeline...",
+    "Parsing and uploading documents...",
+    "Creating query engine...",
+    "Generating report...",
+)
+
+# Forwards stage names from the pipeline's worker loop to the Streamlit script thread
+class StageReporter:
+    def __init__(self, status, progress_bar, stages):
+        self.status = status
+        self.progress_bar = progress_bar
+        self.stages = stages
+        self.stage_queue = queue.Queue()
+        self.wake_event = threading.Event()
+
+    def __call__(self, stage):
+        # Invoked from the background loop; Streamlit elements are only touched in flush()
+        self.stage_queue.put_nowait(stage)
+        self.wake_event.set()
+
+    def flush(self):
+        while True:
+            try:
+                stage = self.stage_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.status.update(label=stage)
+            if stage in self.stages:
+                self.progress_bar.progress(self.stages.index(stage) / len(self.stages))
+
+# Matches "## " section lines and "### " / "N." subsection lines in a single scan
+_OUTLINE_RE = re.compile(r'^(?:(?P<section>## .*)|(?P<subsection>(?:### |[1-9]\.).*))$', re.M)
 
 # Function to parse outline into sections and subsections
+@st.cache_data
 def parse_outline(outline_text):
     sections = []
     current_section = {}
     current_subsections = []
     
-    for line in outline_text.strip().split('\n'):
-        if line.startswith('# '):
-            # Title line, just skip
-            continue
-        elif line.startswith('## '):
+    for match in _OUTLINE_RE.finditer(outline_text.strip()):
+        line = match.group()
+        if match.group('section') is not None:
             # If we have a previous section, save it
             if current_section:
                 current_section['subsections'] = current_subsections
@@ -99,7 +314,7 @@ def parse_outline(outline_text):
             # Start a new section
             current_section = {'title': line.strip('## ').strip(), 'line': line, 'key': f"section_{len(sections)}"}
             current_subsections = []
-        elif line.startswith('### ') or any(line.startswith(f'{i}.') for i in range(1, 10)):
+        else:
             # Subsection
             current_subsections.append({'title': line.strip('### ').strip('0123456789. ').strip(), 'line': line, 'key': f"subsection_{len(sections)}_{len(current_subsections)}"})
     
@@ -110,6 +325,75 @@ def parse_outline(outline_text):
         
     return sections
 
+# Fetched papers list with per-paper removal, isolated from full-app reruns
+@st.fragment
+def fetched_papers_fragment():
+    # Display fetched PDFs in a clean format
+    if st.session_state.stored_pdfs:
+        st.subheader("Fetched Research Papers")
+
+        for paper in list(st.session_state.stored_pdfs):  # Convert to list to avoid modification issues
+            col1, col2, col3 = st.columns([0.8, 0.1, 0.1])
+
+            with col1:
+                st.markdown(f"📄 {paper['title'][:40]}...", unsafe_allow_html=True)
+
+            with col2:
+                st.markdown(
+                    f'<a href="{paper["pdf_link"]}" target="_blank" style="text-decoration: none; color: black; font-size: 18px;">👁️</a>',
+                    unsafe_allow_html=True
+                )
+
+            with col3:
+                if st.button("✖", key=f"remove_{paper['pdf_link']}"):
+                    st.session_state.stored_pdfs = [
+                        p for p in st.session_state.stored_pdfs if p["pdf_link"] != paper["pdf_link"]
+                    ]
+                    
+                    # Remove from fetched PDFs store safely
+                    if paper["title"] in st.session_state.fetched_pdfs_store:
+                        del st.session_state.fetched_pdfs_store[paper["title"]]
+
+                    # Only rerun the paper list, not the whole app
+                    st.rerun(scope="fragment")
+
+    # Merge uploaded and fetched PDFs into a single dictionary for parsing
+    st.session_state.pdf_data_store = {
+        **st.session_state.uploaded_pdfs_store,  # Include uploaded PDFs
+        **st.session_state.fetched_pdfs_store   # Include fetched PDFs
+    }
+
+    st.write(f"⬅️ **Upload or fetch your Papers**")
+    st.write(f"Total PDFs stored: {len(st.session_state.pdf_data_store)}")
+
+# Section/subsection checkboxes for the outline page, isolated from full-app reruns
+@st.fragment
+def outline_selector():
+    for i, section in enumerate(st.session_state.parsed_outline):
+        st.markdown(f"""<div class="section-selector">""", unsafe_allow_html=True)
+        
+        # Section checkbox
+        section_selected = st.checkbox(
+            f"## {section['title']}", 
+            value=st.session_state.selected_sections.get(section['key'], True),
+            key=section['key']
+        )
+        st.session_state.selected_sections[section['key']] = section_selected
+        
+        # Subsections (indented)
+        if section_selected and section['subsections']:
+            cols = st.columns([0.1, 0.9])
+            with cols[1]:
+                for subsection in section['subsections']:
+                    subsection_selected = st.checkbox(
+                        subsection['line'], 
+                        value=st.session_state.selected_sections.get(subsection['key'], True),
+                        key=subsection['key']
+                    )
+                    st.session_state.selected_sections[subsection['key']] = subsection_selected
+        
+        st.markdown("""</div>""", unsafe_allow_html=True)
+
 # Set page configuration
 st.set_page_config(
     page_title="Research Paper Content Generation",
@@ -146,10 +430,6 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def main():
-    # Manually set API keys
-    os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-    os.environ["LLAMA_CLOUD_API_KEY"] = LLAMA_CLOUD_API_KEY
-    
     # Title and introduction
     st.markdown('<div class="main-header">🔬 Research Content Generator</div>', unsafe_allow_html=True)
     
@@ -163,9 +443,11 @@ def main():
     if "query" not in st.session_state:
         st.session_state.query = ""
     if "uploaded_pdfs_store" not in st.session_state:
-        st.session_state.uploaded_pdfs_store = {}  # Store uploaded PDFs separately
+        st.session_state.uploaded_pdfs_store = {}  # Store uploaded PDF bytes separately, keyed by content digest
+    if "uploaded_pdf_digests" not in st.session_state:
+        st.session_state.uploaded_pdf_digests = {}  # Map uploaded file names to content digests
     if "fetched_pdfs_store" not in st.session_state:
-        st.session_state.fetched_pdfs_store = {}  # Store fetched PDFs separately
+        st.session_state.fetched_pdfs_store = {}  # Store fetched PDF bytes separately
     if "stored_pdfs" not in st.session_state:
         st.session_state.stored_pdfs = []  # Store fetched research papers separately
     if "outline" not in st.session_state:
@@ -186,16 +468,22 @@ def main():
 
     # Detect removed files and update session state **only for uploaded PDFs**
     current_uploaded_names = {pdf.name for pdf in uploaded_files} if uploaded_files else set()
-    stored_uploaded_names = set(st.session_state.uploaded_pdfs_store.keys())
+    stored_uploaded_names = set(st.session_state.uploaded_pdf_digests.keys())
 
     for stored_pdf in stored_uploaded_names - current_uploaded_names:
-        del st.session_state.uploaded_pdfs_store[stored_pdf]
+        digest = st.session_state.uploaded_pdf_digests.pop(stored_pdf)
+        # Only drop the bytes once no remaining upload shares the same content
+        if digest not in st.session_state.uploaded_pdf_digests.values():
+            del st.session_state.uploaded_pdfs_store[digest]
 
-    # Store newly uploaded PDFs in session state
+    # Store newly uploaded PDFs in session state, deduplicated by content
     if uploaded_files:
         for pdf in uploaded_files:
-            if pdf.name not in st.session_state.uploaded_pdfs_store:
-                st.session_state.uploaded_pdfs_store[pdf.name] = io.BytesIO(pdf.read())
+            if pdf.name not in st.session_state.uploaded_pdf_digests:
+                pdf_bytes = pdf.getvalue()
+                digest = hashlib.blake2b(pdf_bytes, digest_size=8).hexdigest()
+                st.session_state.uploaded_pdf_digests[pdf.name] = digest
+                st.session_state.uploaded_pdfs_store.setdefault(digest, pdf_bytes)
 
     # Sidebar: Fetch PDFs from ArXiv
     with st.sidebar:
@@ -206,111 +494,50 @@ def main():
             st.session_state.query = query
 
         if st.button("Fetch Papers"):
-            # Fetch papers from ArXiv
-            st.session_state.stored_pdfs = fetch_arxiv_papers(query)
+            try:
+                # Fetch papers from ArXiv and download their PDFs in one async pass
+                (papers, pdfs), _ = run_async_in_thread(fetch_all(query))
+            except httpx.HTTPError:
+                # Fall back to the blocking client and thread pool
+                papers = fetch_arxiv_papers(query)
+                pdfs = download_papers_concurrently(papers)
 
-            # Download PDFs & store in memory (separately from uploads)
-            for paper in st.session_state.stored_pdfs:
-                response = requests.get(paper["pdf_link"])
-                if response.status_code == 200:
-                    st.session_state.fetched_pdfs_store[paper["title"]] = io.BytesIO(response.content)
+            # Store PDFs in memory (separately from uploads)
+            st.session_state.stored_pdfs = papers
+            st.session_state.fetched_pdfs_store.update(pdfs)
 
     # MAIN PAGE LAYOUT
     if st.session_state.current_page == "main":
-        # Display fetched PDFs in a clean format
-        if st.session_state.stored_pdfs:
-            st.subheader("Fetched Research Papers")
-
-            for paper in list(st.session_state.stored_pdfs):  # Convert to list to avoid modification issues
-                col1, col2, col3 = st.columns([0.8, 0.1, 0.1])
-
-                with col1:
-                    st.markdown(f"📄 {paper['title'][:40]}...", unsafe_allow_html=True)
-
-                with col2:
-                    st.markdown(
-                        f'<a href="{paper["pdf_link"]}" target="_blank" style="text-decoration: none; color: black; font-size: 18px;">👁️</a>',
-                        unsafe_allow_html=True
-                    )
-
-                with col3:
-                    if st.button("✖", key=f"remove_{paper['pdf_link']}"):
-                        st.session_state.stored_pdfs = [
-                            p for p in st.session_state.stored_pdfs if p["pdf_link"] != paper["pdf_link"]
-                        ]
-                        
-                        # Remove from fetched PDFs store safely
-                        if paper["title"] in st.session_state.fetched_pdfs_store:
-                            del st.session_state.fetched_pdfs_store[paper["title"]]
-
-                        st.rerun()
-
-        # Merge uploaded and fetched PDFs into a single dictionary for parsing
-        st.session_state.pdf_data_store = {
-            **st.session_state.uploaded_pdfs_store,  # Include uploaded PDFs
-            **st.session_state.fetched_pdfs_store   # Include fetched PDFs
-        }
+        # Fetched papers list (removals rerun only this fragment)
+        fetched_papers_fragment()
 
         # ✅ Concatenate all PDFs into a single variable
-        all_pdfs = list(st.session_state.pdf_data_store.values())  # List of `io.BytesIO` PDF objects
-
-        st.write(f"⬅️ **Upload or fetch your Papers**")
-        st.write(f"Total PDFs stored: {len(all_pdfs)}")
+        all_pdfs = list(st.session_state.pdf_data_store.values())  # List of PDF bytes
 
         col1, col2 = st.columns([1, 3])
         with col1:
             generate_outline_button = st.button("Generate Outline", type="primary", use_container_width=True)
         
         if generate_outline_button and st.session_state.query and len(all_pdfs) > 0:
-            # Create containers for output
-            progress_container = st.container()
-            log_container = st.container()
-            
-            with progress_container:
-                progress_bar = st.progress(0.0)
-                status_text = st.empty()
-            
-            with log_container:
+            # Status container updated as the outline is generated
+            status = st.status("Generating outline structure...", expanded=True)
+            with status:
                 st.markdown('<div class="subheader">Generation Process</div>', unsafe_allow_html=True)
                 log_output = st.empty()
             
-            # Define stages for outline generation
-            outline_stages = [
-                "Analyzing documents...",
-                "Generating outline structure...",
-                "Finalizing outline..."
-            ]
-            
-            # Start a thread for the progress animation
-            stop_event = threading.Event()
-            progress_thread = threading.Thread(
-                target=display_logs_and_progress,
-                args=(progress_bar, status_text, log_output, stop_event, outline_stages)
-            )
-            progress_thread.start()
-            
             try:
-                # Run the outline generation in a separate thread
-                with st.spinner("Generating Outline..."):
-                    # Get the OpenAI client
-                    from llama_index.llms.openai import OpenAI
-                    llm = OpenAI(
-                        api_key=OPENAI_API_KEY, 
-                        model="gpt-3.5-turbo",
-                        temperature=0.3
-                    )
-                    
-                    # Execute outline generation
-                    outline, logs = run_async_in_thread(
-                        generate_outline_from_query(
-                            query=st.session_state.query, 
-                            llm=llm
-                        )
-                    )
+                # Get the cached OpenAI client
+                llm = get_llm("gpt-3.5-turbo", 0.3)
                 
-                # Signal the progress thread to stop
-                stop_event.set()
-                progress_thread.join()
+                # Execute outline generation on the background loop
+                outline, logs = run_async_in_thread(
+                    generate_outline_from_query(
+                        query=st.session_state.query, 
+                        llm=llm
+                    ),
+                    log_output=log_output
+                )
+                status.update(label="Outline generated successfully!", state="complete")
                 
                 # Store the outline in session state
                 st.session_state.outline = outline
@@ -328,10 +555,7 @@ def main():
                 st.rerun()
                 
             except Exception as e:
-                # Signal the progress thread to stop on error
-                stop_event.set()
-                progress_thread.join()
-                
+                status.update(label="Outline generation failed", state="error")
                 st.error(f"An error occurred: {str(e)}")
                 log_output.code(logs if 'logs' in locals() else "", language="")
 
@@ -351,31 +575,8 @@ def main():
         
         st.subheader("Select Sections")
         
-        # Display sections with checkboxes
-        for i, section in enumerate(st.session_state.parsed_outline):
-            st.markdown(f"""<div class="section-selector">""", unsafe_allow_html=True)
-            
-            # Section checkbox
-            section_selected = st.checkbox(
-                f"## {section['title']}", 
-                value=st.session_state.selected_sections.get(section['key'], True),
-                key=section['key']
-            )
-            st.session_state.selected_sections[section['key']] = section_selected
-            
-            # Subsections (indented)
-            if section_selected and section['subsections']:
-                cols = st.columns([0.1, 0.9])
-                with cols[1]:
-                    for subsection in section['subsections']:
-                        subsection_selected = st.checkbox(
-                            subsection['line'], 
-                            value=st.session_state.selected_sections.get(subsection['key'], True),
-                            key=subsection['key']
-                        )
-                        st.session_state.selected_sections[subsection['key']] = subsection_selected
-            
-            st.markdown("""</div>""", unsafe_allow_html=True)
+        # Display sections with checkboxes (reruns only this fragment on toggle)
+        outline_selector()
         
         # Generate content button
         generate_content_col1, generate_content_col2 = st.columns([1, 3])
@@ -384,87 +585,64 @@ def main():
         
         if generate_content_button:
             # First, filter the outline to only include selected sections
-            filtered_outline = "# Research Paper Report\n\n"
+            outline_parts = ["# Research Paper Report"]
             
             for section in st.session_state.parsed_outline:
                 if st.session_state.selected_sections.get(section['key'], False):
-                    filtered_outline += f"## {section['title']}\n\n"
+                    outline_parts.append(f"## {section['title']}")
                     
                     # Add selected subsections
                     for subsection in section['subsections']:
                         if st.session_state.selected_sections.get(subsection['key'], False):
-                            filtered_outline += f"{subsection['line']}\n\n"
+                            outline_parts.append(subsection['line'])
             
-            # Create containers for output
-            progress_container = st.container()
-            log_container = st.container()
+            filtered_outline = "\n\n".join(outline_parts) + "\n\n"
             
-            with progress_container:
+            # Status container driven by the pipeline's real stages
+            status = st.status("Generating Paper Content...", expanded=True)
+            with status:
                 progress_bar = st.progress(0.0)
-                status_text = st.empty()
-            
-            with log_container:
                 st.markdown('<div class="subheader">Generation Process</div>', unsafe_allow_html=True)
                 log_output = st.empty()
             
-            # Define stages for content generation
-            content_stages = [
-                "Generating outline...",
-                "Downloading research papers...",
-                "Parsing documents...",
-                "Creating pipeline...",
-                "Uploading documents...",
-                "Creating query engine...",
-                "Generating report..."
-            ]
-            
-            # Start a thread for the progress animation
-            stop_event = threading.Event()
-            progress_thread = threading.Thread(
-                target=display_logs_and_progress,
-                args=(progress_bar, status_text, log_output, stop_event, content_stages)
-            )
-            progress_thread.start()
+            stage_reporter = StageReporter(status, progress_bar, CONTENT_STAGES)
             
             try:
-                # Get all PDFs
-                all_pdfs = list(st.session_state.pdf_data_store.values())
+                # Wrap each PDF in a fresh BytesIO so every run starts at offset 0
+                all_pdfs = [io.BytesIO(pdf_bytes) for pdf_bytes in st.session_state.pdf_data_store.values()]
                 
-                # Run the paper generation in a separate thread
-                with st.spinner("Generating Paper Content..."):
-                    # Execute the paper generation with the filtered outline
-                    result, logs = run_async_in_thread(
-                        initialize_research_pipeline(
-                            query=st.session_state.query, 
-                            pdf=all_pdfs,
-                            model="gpt-3.5-turbo", 
-                            max_retries=1,
-                            custom_outline=filtered_outline  # Pass the filtered outline
-                        )
-                    )
+                # Execute the paper generation with the filtered outline
+                result, logs = run_async_in_thread(
+                    initialize_research_pipeline(
+                        query=st.session_state.query, 
+                        pdf=all_pdfs,
+                        model="gpt-3.5-turbo", 
+                        max_retries=1,
+                        custom_outline=filtered_outline,  # Pass the filtered outline
+                        on_stage=stage_reporter
+                    ),
+                    log_output=log_output,
+                    stage_reporter=stage_reporter
+                )
                 
                 # Update log output
                 log_output.code(logs, language="")
                 
-                # Signal the progress thread to stop
-                stop_event.set()
-                progress_thread.join()
-                
                 # Store the generated content
                 if result and 'response' in result and result['response']:
+                    progress_bar.progress(1.0)
+                    status.update(label="Process completed successfully!", state="complete")
                     st.session_state.paper_content = result['response']
                     
                     # Move to content page
                     st.session_state.current_page = "content"
                     st.rerun()
                 else:
+                    status.update(label="Content generation failed", state="error")
                     st.error("Failed to generate content. Please try again.")
                     
             except Exception as e:
-                # Signal the progress thread to stop on error
-                stop_event.set()
-                progress_thread.join()
-                
+                status.update(label="Content generation failed", state="error")
                 st.error(f"An error occurred: {str(e)}")
                 log_output.code(logs if 'logs' in locals() else "", language="")
 
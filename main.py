@@ -1,24 +1,40 @@
 import os
 from dotenv import load_dotenv
 import asyncio
-import time
+import hashlib
+import io
+import logging
+import random
+import re
+from pathlib import Path
 import streamlit as st
 
-import nest_asyncio
-from llama_index.llms.openai import OpenAI
-
-from src.config import RESEARCH_PAPER_TOPICS, NUM_RESULTS_PER_TOPIC
+from src.config import RESEARCH_PAPER_TOPICS, NUM_RESULTS_PER_TOPIC, CACHE_DIR
 from src.arxiv_downloader import download_papers, list_pdf_files
 from src.document_parser import parse_pdf_files
-from src.llama_cloud_pipeline import create_llamacloud_pipeline, upload_documents
+from src.llama_cloud_pipeline import create_llamacloud_pipeline, create_documents_in_batches, get_document_upload
 from src.query_engine import create_query_engine
-from src.report_generator import ReportGenerationAgent
+from src.llm_cache import acomplete_once
+from src.openai_clients import create_llm
+from src.disk_cache import read_json, write_json
+from src.report_generator import ReportGenerationAgent, parse_outline_structure, with_backoff
 
 # Load environment variables
 load_dotenv()
 
-# Apply nest_asyncio to allow nested event loops
-nest_asyncio.apply()
+logger = logging.getLogger(__name__)
+
+# Matches a "## " section heading at the start of any line
+SECTION_HEADING_RE = re.compile(r'^## ', re.M)
+
+# Matches a level-2 conclusion heading at the start of a line, numbered or not (e.g. "## Conclusion", "## 5. Conclusion")
+CONCLUSION_HEADING_RE = re.compile(r'^##\s+(?:\d+\.\s*)?Conclusion', re.I | re.M)
+
+# Metadata extraction is network-bound; cap concurrent LLM calls across all PDFs
+MAX_METADATA_CONCURRENCY = 16
+
+# Local manifest of PDFs already uploaded to LlamaCloud
+UPLOAD_MANIFEST_PATH = Path(CACHE_DIR) / "uploaded.json"
 
 async def generate_outline_from_query(query, llm):
     """
@@ -31,8 +47,9 @@ async def generate_outline_from_query(query, llm):
     Returns:
         str: A structured outline for the research paper.
     """
+    # Keep the fixed format instructions first so the prompt prefix is reusable across queries
     prompt = f"""
-    Generate a detailed research paper outline for the following topic: "{query}"
+    Generate a detailed research paper outline for the topic given at the end.
     
     The outline should follow this format exactly:
     
@@ -53,22 +70,24 @@ async def generate_outline_from_query(query, llm):
     
     Replace the bracketed text with relevant content for the query topic.
     Ensure the outline is comprehensive, logical, and focused on the query topic.
+    
+    Topic: "{query}"
     """
     
-    response = await llm.acomplete(prompt)
-    outline = response.text.strip()
+    response_text = await acomplete_once(llm, prompt)
+    outline = response_text.strip()
     
     # Ensure the outline has proper formatting
     if not outline.startswith("# Research Paper"):
         outline = f"# Research Paper Report on {query}\n\n" + outline
     
     # Make sure there's a conclusion section
-    if "## Conclusion" not in outline and "## 4. Conclusion" not in outline:
+    if not CONCLUSION_HEADING_RE.search(outline):
         outline += "\n\n## 4. Conclusion"
     
     return outline
 
-async def initialize_research_pipeline(query, pdf, model="gpt-3.5-turbo", max_retries=1, custom_outline=None):
+async def initialize_research_pipeline(query, pdf, model="gpt-3.5-turbo", max_retries=1, custom_outline=None, on_stage=None):
     """
     Initialize the research pipeline and generate report based on a query.
     
@@ -78,6 +97,7 @@ async def initialize_research_pipeline(query, pdf, model="gpt-3.5-turbo", max_re
         model (str, optional): OpenAI model to use. Defaults to "gpt-3.5-turbo".
         max_retries (int, optional): Maximum number of retries for generation. Defaults to 1.
         custom_outline (str, optional): Custom outline to use instead of generating a new one.
+        on_stage (callable, optional): Called with the name of each pipeline stage as it starts.
         
     Returns:
         dict: Generated report
@@ -95,8 +115,10 @@ async def initialize_research_pipeline(query, pdf, model="gpt-3.5-turbo", max_re
     if not openai_api_key or not llama_cloud_api_key:
         raise ValueError("Missing API keys. Please set OPENAI_API_KEY and LLAMA_CLOUD_API_KEY in .env file.")
 
-    # Initialize language model with a valid model name
-    llm = OpenAI(
+    report_stage = on_stage or (lambda stage: None)
+
+    # Initialize language model with a valid model name, over pooled HTTP/2 connections
+    llm = create_llm(
         api_key=openai_api_key, 
         model=model,
         temperature=0.3,
@@ -107,11 +129,9 @@ async def initialize_research_pipeline(query, pdf, model="gpt-3.5-turbo", max_re
     if custom_outline:
         outline = custom_outline
     else:
+        report_stage("Generating outline...")
         outline = await generate_outline_from_query(query, llm)
 
-    # Parse documents
-    documents = parse_pdf_files(pdf)
-
     # Embedding and transformation configurations
     embedding_config = {
         'type': 'OPENAI_EMBEDDING',
@@ -130,13 +150,26 @@ async def initialize_research_pipeline(query, pdf, model="gpt-3.5-turbo", max_re
     }
 
     # Create LlamaCloud pipeline
-    client, pipeline = create_llamacloud_pipeline('report_generation', embedding_config, transform_config)
+    report_stage("Creating pipeline...")
+    client, pipeline = await asyncio.to_thread(
+        create_llamacloud_pipeline, 'report_generation', embedding_config, transform_config
+    )
 
-    # Upload documents
-    await upload_documents(client, pipeline, documents, llm)
+    # Parse and upload documents, overlapping the two stages
+    report_stage("Parsing and uploading documents...")
+    uploaded_digests = await parse_and_upload_documents(client, pipeline, pdf, llm)
+    # Cached query answers are keyed on the pipeline and the set of documents in it
+    index_version = hashlib.sha256(
+        "\0".join([pipeline.id, *sorted(uploaded_digests)]).encode()
+    ).hexdigest()
 
     # Create query engine
-    query_engine = create_query_engine(llama_cloud_api_key)
+    report_stage("Creating query engine...")
+    query_engine = await asyncio.to_thread(create_query_engine, llama_cloud_api_key)
+    # Cheaper engine without reranking for simple lookups
+    fast_query_engine = await asyncio.to_thread(
+        create_query_engine, llama_cloud_api_key, enable_reranking=False, top_k=5
+    )
 
     # Process the outline into sections for potential section-by-section generation
     sections = parse_outline_sections(outline)
@@ -144,12 +177,16 @@ async def initialize_research_pipeline(query, pdf, model="gpt-3.5-turbo", max_re
     # Initialize report generation agent
     agent = ReportGenerationAgent(
         query_engine=query_engine,
+        fast_query_engine=fast_query_engine,
+        index_version=index_version,
         llm=llm,
         verbose=True,
         timeout=2400.0  # Extend timeout to 40 minutes
     )
    
     # Attempt generation with retries
+    report_stage("Generating report...")
+    partial_response = None
     for attempt in range(max_retries):
         try:
             report = await agent.run(outline=outline)
@@ -162,82 +199,229 @@ async def initialize_research_pipeline(query, pdf, model="gpt-3.5-turbo", max_re
                     "success": True
                 }
             else:
-                # Short delay before retry
-                time.sleep(5) 
+                # Keep the incomplete draft in case it is worth finishing rather than regenerating
+                partial_response = report.get('response') or partial_response
+                # Short delay before retry, backing off exponentially with jitter
+                await asyncio.sleep(5 * 2 ** attempt + random.uniform(0, 1))
         except Exception as e:
             if attempt < max_retries - 1:
-                print("Retrying...")
-                time.sleep(10)  # Wait longer after an error
+                logger.warning("Retrying...")
+                await asyncio.sleep(10 * 2 ** attempt + random.uniform(0, 1))  # Wait longer after an error
             else:
                 raise
     
-    # If we reach here without returning, try fallback to section-by-section generation
-    full_report = await generate_report_by_sections(agent, sections)
+    # If we reach here without returning, finish a mostly complete draft with a single call,
+    # otherwise fall back to section-by-section generation
+    if partial_response and is_mostly_complete(partial_response, sections):
+        full_report = await complete_partial_report(llm, outline, partial_response)
+    else:
+        full_report = await generate_report_by_sections(agent, sections)
     return {
         "response": full_report,
         "outline": outline,
         "success": True
     }
 
+@st.cache_data(max_entries=64, persist="disk")
+def parse_pdf_cached(pdf_bytes):
+    """
+    Parse a single PDF, memoized on disk by its content so re-runs skip LlamaParse.
+    
+    Args:
+        pdf_bytes (bytes): Raw PDF content
+    
+    Returns:
+        list: Parsed documents
+    """
+    # Runs in a worker thread, so it can drive its own event loop
+    documents = asyncio.run(parse_pdf_files([io.BytesIO(pdf_bytes)]))
+    if not documents:
+        # Raise so that failed parses are not persisted in the cache
+        raise ValueError("PDF could not be parsed")
+    return documents
+
+async def parse_pdf(pdf_file):
+    """Parse a PDF file path or file-like object, using the content cache for in-memory PDFs"""
+    if not hasattr(pdf_file, "read"):
+        return await parse_pdf_files([pdf_file])
+
+    pdf_file.seek(0)
+    try:
+        # The cached parser blocks, so run it off the event loop
+        return await asyncio.to_thread(parse_pdf_cached, pdf_file.read())
+    except ValueError as e:
+        logger.warning(f"Skipping PDF: {e}")
+        return []
+
+def pdf_digest(pdf_file):
+    """SHA-256 of a PDF's content, for file paths or file-like objects"""
+    if hasattr(pdf_file, "read"):
+        pdf_file.seek(0)
+        return hashlib.sha256(pdf_file.read()).hexdigest()
+    with open(pdf_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+async def parse_and_upload_documents(client, pipeline, pdf, llm):
+    """
+    Parse PDFs and upload them to LlamaCloud.
+    
+    Each PDF's documents go to metadata extraction as soon as that PDF is parsed,
+    so parsing of one PDF overlaps with preparing another for upload.
+    PDFs already uploaded to this pipeline (tracked by content hash in a local
+    manifest) are skipped entirely, as are duplicate copies of the same PDF.
+    
+    Args:
+        client (LlamaCloud): LlamaCloud client
+        pipeline (Pipeline): Created pipeline
+        pdf (list): List of PDF file objects to process
+        llm (OpenAI): Language model instance
+    
+    Returns:
+        list: SHA-256 digests of every PDF uploaded to this pipeline
+    """
+    # Manifest maps pipeline id -> {pdf sha256: LlamaCloud document id}
+    manifest = await asyncio.to_thread(read_json, UPLOAD_MANIFEST_PATH) or {}
+    uploaded = manifest.setdefault(pipeline.id, {})
+
+    # Hash PDFs off the event loop
+    pdf_digests = await asyncio.gather(*(asyncio.to_thread(pdf_digest, pdf_file) for pdf_file in pdf))
+
+    # Skip PDFs already uploaded, and duplicates of the same paper within this batch
+    new_files = {}
+    for digest, pdf_file in zip(pdf_digests, pdf):
+        if digest not in uploaded and digest not in new_files:
+            new_files[digest] = pdf_file
+
+    if not new_files:
+        logger.info("All documents were already uploaded; skipping parsing and upload")
+        return list(uploaded)
+
+    metadata_semaphore = asyncio.Semaphore(MAX_METADATA_CONCURRENCY)
+
+    async def prepare_document(document):
+        async with metadata_semaphore:
+            return await get_document_upload(document, llm)
+
+    async def prepare(digest, pdf_file):
+        # Prepare this PDF's documents as soon as it is parsed, while other PDFs are still parsing
+        documents = await parse_pdf(pdf_file)
+        uploads = await asyncio.gather(*(prepare_document(document) for document in documents))
+        return [(digest, upload) for upload in uploads]
+
+    tasks = [asyncio.ensure_future(prepare(digest, pdf_file)) for digest, pdf_file in new_files.items()]
+    try:
+        prepared = await asyncio.gather(*tasks)
+    finally:
+        # Stop the remaining PDFs if one of them failed
+        for task in tasks:
+            task.cancel()
+
+    digests = [digest for items in prepared for digest, _ in items]
+    document_upload_objs = [upload for items in prepared for _, upload in items]
+    if not document_upload_objs:
+        return list(uploaded)
+
+    cloud_documents = await create_documents_in_batches(client, pipeline, document_upload_objs)
+
+    # Record uploaded documents so later runs can skip them
+    for digest, cloud_document in zip(digests, cloud_documents):
+        uploaded[digest] = cloud_document.id
+    await asyncio.to_thread(write_json, UPLOAD_MANIFEST_PATH, manifest)
+    return list(uploaded)
+
 def parse_outline_sections(outline):
     """Parse outline into sections for separate generation"""
-    lines = outline.strip().split('\n')
-    sections = []
-    current_section = []
+    # Split once on "## " headings; any text before the first heading is its own section
+    parts = outline.strip().split('\n## ')
+    return [parts[0]] + ['## ' + part for part in parts[1:]]
+
+def is_mostly_complete(draft, sections):
+    """Check whether a draft report already contains more than half of the outline's sections"""
+    expected = sum(1 for section in sections if section.startswith('## '))
+    found = len(SECTION_HEADING_RE.findall(draft))
+    return expected > 0 and found * 2 > expected
+
+def normalize_section_title(title):
+    """Normalize a section title for comparison, ignoring case and a trailing colon"""
+    return title.strip().rstrip(':').strip().casefold()
+
+async def complete_partial_report(llm, outline, draft):
+    """Write only the outline sections missing from a partial report and append them to the draft"""
+    # Compare parsed section titles, since the report numbers sections the outline may leave unnumbered
+    _, outline_sections = parse_outline_structure(outline)
+    _, draft_sections = parse_outline_structure(draft)
+    written = {normalize_section_title(section.title) for section in draft_sections}
+    missing = [section for section in outline_sections if normalize_section_title(section.title) not in written]
+    if not missing:
+        return draft
+
+    missing_outline = "\n\n".join(
+        "\n".join([f"## {section.number} {section.title}"] + [subsection.key for subsection in section.subsections])
+        for section in missing
+    )
+    prompt = f"""Below are a partially written research paper report and the outline sections it is still missing.
+    Write exactly these sections, using their markdown headings as given.
+    Do not repeat sections already in the report and do not add any other sections.
     
-    for line in lines:
-        if line.startswith('## '):
-            if current_section:
-                sections.append('\n'.join(current_section))
-            current_section = [line]
-        else:
-            current_section.append(line)
+    Missing sections:
+    {missing_outline}
     
-    if current_section:
-        sections.append('\n'.join(current_section))
+    Partial report:
+    {draft}"""
     
-    return sections
+    completion = await with_backoff(lambda: acomplete_once(llm, prompt))
+    return draft.rstrip() + "\n\n" + completion.strip()
 
-async def generate_report_by_sections(agent, sections):
-    """Generate report section by section as a fallback approach"""
-    full_report = []
+async def generate_report_by_sections(agent, sections, max_concurrency=5):
+    """Generate report section by section as a fallback approach, running sections concurrently"""
+    # Bound concurrent agent runs to respect API rate limits
+    semaphore = asyncio.Semaphore(max_concurrency)
     
-    # Generate the title and intro first
+    # Generate the title and intro together
     intro_outline = sections[0]
     if len(sections) > 1:
         intro_outline += "\n" + sections[1]
     
-    intro_result = await agent.run(outline=intro_outline)
-    if 'response' in intro_result and intro_result['response']:
-        full_report.append(intro_result['response'])
+    async def generate_intro():
+        async with semaphore:
+            intro_result = await agent.run(outline=intro_outline)
+        if 'response' in intro_result and intro_result['response']:
+            return intro_result['response']
+        return None
     
-    # Generate each content section
-    for i in range(2, len(sections)):
-        section_outline = sections[i]
+    async def generate_section(section_outline):
         try:
-            section_result = await agent.run(outline=section_outline)
+            async with semaphore:
+                section_result = await agent.run(outline=section_outline)
             if 'response' in section_result and section_result['response']:
                 # Extract just the section content without repeating headers
-                section_content = extract_section_content(section_result['response'])
-                full_report.append(section_content)
+                return extract_section_content(section_result['response'])
         except Exception as e:
             # Add placeholder if section generation fails
-            full_report.append(f"\n## {section_outline.strip().split()[1]}\n\nContent generation incomplete for this section.\n")
+            return f"\n## {section_outline.strip().split()[1]}\n\nContent generation incomplete for this section.\n"
+        return None
+    
+    # Run all sections concurrently; gather keeps results in outline order
+    results = await asyncio.gather(
+        generate_intro(),
+        *(generate_section(sections[i]) for i in range(2, len(sections)))
+    )
+    full_report = [result for result in results if result]
     
     return "\n\n".join(full_report)
 
+async def download_and_generate(query, model):
+    """Download source papers for a query and run the research pipeline on them"""
+    pdf_paths = await download_papers([query], NUM_RESULTS_PER_TOPIC)
+    return await initialize_research_pipeline(query=query, pdf=pdf_paths, model=model)
+
 def extract_section_content(section_text):
     """Extract section content without title and intro duplication"""
-    lines = section_text.strip().split('\n')
-    start_idx = 0
+    section_text = section_text.strip()
     
     # Find where actual section content starts, skipping any title and intro
-    for i, line in enumerate(lines):
-        if line.startswith('## '):
-            start_idx = i
-            break
-    
-    return '\n'.join(lines[start_idx:])
+    heading = SECTION_HEADING_RE.search(section_text)
+    return section_text[heading.start():] if heading else section_text
 
 # CLI version for testing
 if __name__ == "__main__":
@@ -248,7 +432,8 @@ if __name__ == "__main__":
         # Get query from user input
         user_query = input("Enter your research topic query (e.g., 'quantum computing applications in cybersecurity'): ")
         
-        report = asyncio.run(initialize_research_pipeline(query=user_query, model=model_to_use))
+        # Download source papers and generate the report on a single event loop
+        report = asyncio.run(download_and_generate(user_query, model_to_use))
         
         if report and 'response' in report and report['response']:
             print("\nReport generated successfully!")
@@ -1,10 +1,56 @@
 import io
-import re
-from typing import List, Dict, Any, Tuple
+import logging
+from typing import List, Dict, Any, Optional, Tuple
 from llama_index.core import Document
+from llama_index.core.llms import ChatMessage
 from llama_index.core.node_parser import HierarchicalNodeParser
 from llama_index.llms.openai import OpenAI
 
+logger = logging.getLogger(__name__)
+
+# Standard academic outline structure template
+STANDARD_OUTLINE_TEMPLATE = """
+* **Abstract**
+   * Brief summary of the research including objectives, methodology, and key results.
+* **Introduction**
+   * **Problem Statement**: What problem is being addressed?
+   * **Objective of the Study**: Main goal of the research.
+   * **Significance**: Why is this study important?
+   * **Scope**: What is included and excluded from this study?
+   * **Overview of the Paper**: A brief description of each subsequent section.
+* **Literature Review**
+   * **Existing Work**: Overview of previous research related to the topic.
+   * **Theoretical Framework**: The theories or models guiding the research.
+   * **Gap in the Literature**: What gaps are identified and how does the research fill them?
+* **Methodology**
+   * **Research Design**: Type of research (e.g., experimental, qualitative).
+   * **Data Collection**: How data was gathered (e.g., surveys, experiments).
+   * **Data Analysis**: Techniques used to analyze the data (e.g., statistical analysis, coding).
+   * **Limitations**: Potential limitations in the study methodology.
+* **Results**
+   * **Presentation of Findings**: What was discovered during the research.
+   * **Statistical Analysis**: If applicable, statistical results (e.g., p-values, correlation coefficients).
+   * **Tables and Figures**: Relevant data visualizations.
+* **Discussion**
+   * **Interpretation of Results**: What do the results mean?
+   * **Implications**: How do the results contribute to the field or solve the problem?
+   * **Comparison with Previous Work**: How does the research align or differ from earlier studies?
+* **Conclusion**
+   * **Summary of Key Findings**: Recap of the main results.
+   * **Contributions to Knowledge**: What new insights or contributions does the study offer?
+   * **Future Research**: What areas could future studies explore?
+* **References**
+   * **Bibliography**: Citations of all sources referenced throughout the paper.
+* **Appendices** (if applicable)
+   * **Additional Materials**: Any supplementary data or materials that support the research.
+"""
+
+# Fixed system prompt; kept identical across calls so the provider can reuse its prefix
+OUTLINE_SYSTEM_PROMPT = f"""You generate outlines of research papers in markdown.
+Follow this exact structure and headings, adapting the details to the paper's content. Keep every section even if the paper lacks it, noting that it may need more development.
+{STANDARD_OUTLINE_TEMPLATE}
+Return only the outline."""
+
 def hierarchical_chunk_pdf(pdf_data: io.BytesIO) -> List[Document]:
     """
     Process a PDF using hierarchical chunking to preserve document structure.
@@ -16,13 +62,14 @@ def hierarchical_chunk_pdf(pdf_data: io.BytesIO) -> List[Document]:
         List of Document objects with hierarchical structure
     """
     try:
-        from PyPDF2 import PdfReader
+        import pypdfium2 as pdfium
         
-        # Extract text from PDF
-        pdf_reader = PdfReader(pdf_data)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
+        # Extract text from PDF, joining pages once instead of growing a string
+        pdf = pdfium.PdfDocument(pdf_data)
+        try:
+            text = "\n".join(page.get_textpage().get_text_range() for page in pdf) + "\n"
+        finally:
+            pdf.close()
         
         # Create hierarchical node parser
         # This will chunk text while respecting document hierarchy
@@ -40,7 +87,7 @@ def hierarchical_chunk_pdf(pdf_data: io.BytesIO) -> List[Document]:
         
         return nodes
     except Exception as e:
-        print(f"Error in hierarchical chunking: {str(e)}")
+        logger.error(f"Error in hierarchical chunking: {str(e)}")
         return []
 
 def extract_outline_from_nodes(nodes, query: str = None, openai_api_key: str = None) -> Tuple[str, str]:
@@ -59,8 +106,8 @@ def extract_outline_from_nodes(nodes, query: str = None, openai_api_key: str = N
     
     # Extract content samples from nodes for LLM analysis
     content_samples = []
-    for i, node in enumerate(nodes):
-        if i >= 30:  # Limit to first 30 nodes to avoid token limits
+    for node in nodes:
+        if len(content_samples) >= 10:  # Only the first 10 samples are sent to the LLM
             break
             
         # Ensure we have a string representation of the text
@@ -84,81 +131,84 @@ def extract_outline_from_nodes(nodes, query: str = None, openai_api_key: str = N
     )
     
     # Format content samples for LLM processing
-    content_text = "\n\n".join([f"Sample {i+1}:\n{sample}" for i, sample in enumerate(content_samples[:10])])
+    content_text = "\n\n".join([f"Sample {i+1}:\n{sample}" for i, sample in enumerate(content_samples)])
     
-    # Standard academic outline structure template
-    standard_outline_template = """
-* **Abstract**
-   * Brief summary of the research including objectives, methodology, and key results.
-* **Introduction**
-   * **Problem Statement**: What problem is being addressed?
-   * **Objective of the Study**: Main goal of the research.
-   * **Significance**: Why is this study important?
-   * **Scope**: What is included and excluded from this study?
-   * **Overview of the Paper**: A brief description of each subsequent section.
-* **Literature Review**
-   * **Existing Work**: Overview of previous research related to the topic.
-   * **Theoretical Framework**: The theories or models guiding the research.
-   * **Gap in the Literature**: What gaps are identified and how does the research fill them?
-* **Methodology**
-   * **Research Design**: Type of research (e.g., experimental, qualitative).
-   * **Data Collection**: How data was gathered (e.g., surveys, experiments).
-   * **Data Analysis**: Techniques used to analyze the data (e.g., statistical analysis, coding).
-   * **Limitations**: Potential limitations in the study methodology.
-* **Results**
-   * **Presentation of Findings**: What was discovered during the research.
-   * **Statistical Analysis**: If applicable, statistical results (e.g., p-values, correlation coefficients).
-   * **Tables and Figures**: Relevant data visualizations.
-* **Discussion**
-   * **Interpretation of Results**: What do the results mean?
-   * **Implications**: How do the results contribute to the field or solve the problem?
-   * **Comparison with Previous Work**: How does the research align or differ from earlier studies?
-* **Conclusion**
-   * **Summary of Key Findings**: Recap of the main results.
-   * **Contributions to Knowledge**: What new insights or contributions does the study offer?
-   * **Future Research**: What areas could future studies explore?
-* **References**
-   * **Bibliography**: Citations of all sources referenced throughout the paper.
-* **Appendices** (if applicable)
-   * **Additional Materials**: Any supplementary data or materials that support the research.
-"""
-    
-    # Create LLM prompt
-    prompt = f"""
-    I'm analyzing a research paper and need to generate an outline following a standard academic format.
-    
-    Here are some content samples from the paper:
+    # Only the paper samples and query vary between calls
+    messages = [
+        ChatMessage(role="system", content=OUTLINE_SYSTEM_PROMPT),
+        ChatMessage(role="user", content=f"""Focus: {query if query else 'the general topic of the paper'}
+
+Content samples from the paper:
+
+{content_text}"""),
+    ]
     
-    {content_text}
+    logs += "Generating standardized academic outline...\n"
     
-    Please create an outline following this EXACT structure, but adapt it to reflect the content of the specific paper:
+    response = llm.chat(messages)
+    outline = response.message.content or ""
     
-    {standard_outline_template}
+    logs += "Outline generation complete.\n"
+    return outline, logs
+
+def outline_indent(line: str) -> Optional[int]:
+    """
+    Measure the indentation of an outline bullet line.
     
-    Add relevant details from the paper to each section. If certain sections don't seem to exist in the paper, still include them in the outline but note they may need more development.
+    Args:
+        line: A single line of the outline
+        
+    Returns:
+        Number of leading whitespace characters, or None if the line is not a bullet
+    """
+    stripped = line.lstrip()
+    if len(stripped) < 2 or stripped[0] not in '*-' or not stripped[1].isspace():
+        return None
+    return len(line) - len(stripped)
+
+def classify_outline_line(line: str, base_indent: int = 0) -> Optional[Tuple[int, str, str]]:
+    """
+    Classify a markdown outline line with plain string operations.
     
-    If a specific research query was provided, focus the outline details around: {query if query else 'the general topic of the paper'}
+    Main sections are bullets at the outline's base indentation with a bold
+    title ("* **Title**"); subsections are bullets indented further, with a
+    bold or plain title and an optional ": description".
     
-    Return only the outline in markdown format, using the exact same structure and headings as the template.
+    Args:
+        line: A single line of the outline
+        base_indent: Indentation of the outline's least indented bullets
+        
+    Returns:
+        Tuple of (level, title, description) with level 1 for sections and
+        2 for subsections, or None if the line is neither
     """
+    indent = outline_indent(line)
+    if indent is None:
+        return None
     
-    logs += "Generating standardized academic outline...\n"
+    level = 1 if indent <= base_indent else 2
+    body = line.lstrip()[1:].lstrip()
     
-    # Handle the LLM response safely
-    response = llm.complete(prompt)
+    # Bold title wrapped in ** or __
+    marker = body[:2]
+    if marker in ('**', '__'):
+        close = body.find(marker, 2)
+        if close > 2:
+            title = body[2:close].strip()
+            if level == 1:
+                return 1, title, ""
+            rest = body[close + 2:]
+            if rest.startswith(':'):
+                rest = rest[1:]
+            return 2, title, rest.strip()
     
-    # Handle different response formats
-    if hasattr(response, 'text'):
-        outline = response.text
-    elif isinstance(response, tuple):
-        outline = str(response[0]) if response else ""
-    elif isinstance(response, str):
-        outline = response
-    else:
-        outline = str(response)
+    # Main sections must have a bold title
+    if level == 1:
+        return None
     
-    logs += "Outline generation complete.\n"
-    return outline, logs
+    # Plain subsection title, optionally followed by ": description"
+    title, _, description = body.partition(':')
+    return 2, title.strip() or "Untitled subsection", description.strip()
 
 def parse_outline(outline_text: str) -> Dict[str, Any]:
     """
@@ -177,46 +227,34 @@ def parse_outline(outline_text: str) -> Dict[str, Any]:
     # Create structured representation
     outline_structure = {"sections": []}
     
-    # Pattern to identify main sections (starts with * or - and has ** or __ around the title)
-    main_section_pattern = re.compile(r'^\s*[\*\-]\s+[\*\_]{2}([^*_]+)[\*\_]{2}')
-    
-    # Pattern to identify subsections (starts with multiple spaces, then * or - and has ** or __ or nothing around the title)
-    subsection_pattern = re.compile(r'^\s+[\*\-]\s+([\*\_]{2}([^*_]+)[\*\_]{2}|([^:]+))(?::)?(.+)?')
-    
     current_section = None
-    lines = outline_text.strip().split('\n')
+    # Keep leading whitespace so indentation is measured consistently on every line
+    lines = outline_text.splitlines()
+    
+    # Sections sit at the smallest bullet indentation, wherever the outline starts
+    indents = [indent for indent in map(outline_indent, lines) if indent is not None]
+    base_indent = min(indents, default=0)
     
     for line in lines:
-        if not isinstance(line, str):
-            line = str(line)
-            
-        # Check for main section
-        main_match = main_section_pattern.match(line)
-        if main_match:
-            section_title = main_match.group(1).strip()
+        classified = classify_outline_line(line, base_indent)
+        if classified is None:
+            continue
+        level, title, description = classified
+        
+        # Main section
+        if level == 1:
             current_section = {
-                "title": section_title,
+                "title": title,
                 "key": f"section_{len(outline_structure['sections'])}",
                 "subsections": []
             }
             outline_structure["sections"].append(current_section)
             continue
             
-        # Check for subsection
-        sub_match = subsection_pattern.match(line)
-        if sub_match and current_section is not None:
-            # Try to extract both the subsection title and description
-            if sub_match.group(2):  # Bold format with **title**
-                subsection_title = sub_match.group(2).strip()
-            elif sub_match.group(3):  # No bold format
-                subsection_title = sub_match.group(3).strip()
-            else:
-                subsection_title = "Untitled subsection"
-                
-            description = sub_match.group(4).strip() if sub_match.group(4) else ""
-            
+        # Subsection
+        if current_section is not None:
             subsection = {
-                "title": subsection_title,
+                "title": title,
                 "key": f"subsection_{len(outline_structure['sections'])-1}_{len(current_section['subsections'])}",
                 "description": description
             }
@@ -1,31 +1,102 @@
+import asyncio
+import hashlib
+import logging
+import os
 import arxiv
-from pathlib import Path
+import httpx
+from src.disk_cache import cache_path, is_fresh, read_json, write_json
 
-def download_papers(topics, num_results_per_topic):
+logger = logging.getLogger(__name__)
+
+# Search results are reused for a day before querying arxiv again
+SEARCH_CACHE_TTL = 24 * 60 * 60
+
+def cached_search(client, topic, num_results, sort_by):
+    """
+    Search arxiv for a topic, caching the results on disk
+    
+    Args:
+        client (arxiv.Client): Arxiv API client
+        topic (str): Research topic
+        num_results (int): Maximum number of results
+        sort_by (arxiv.SortCriterion): Sort order of the results
+    
+    Returns:
+        list: List of {"title", "pdf_url", "entry_id"} dicts
+    """
+    key = hashlib.sha256(f"{topic}|{num_results}|{sort_by.value}".encode()).hexdigest()
+    path = cache_path("arxiv_search", key)
+    if is_fresh(path, SEARCH_CACHE_TTL):
+        cached = read_json(path)
+        if cached is not None:
+            return cached
+
+    search = arxiv.Search(
+        query=topic,
+        max_results=num_results,
+        sort_by=sort_by
+    )
+    papers = [
+        {"title": r.title, "pdf_url": r.pdf_url, "entry_id": r.entry_id}
+        for r in client.results(search)
+    ]
+    write_json(path, papers)
+    return papers
+
+async def download_papers(topics, num_results_per_topic, max_concurrency=8, dirpath='.'):
     """
     Download papers from arxiv for given topics and number of results per topic
     
     Args:
         topics (list): List of research topics
         num_results_per_topic (int): Number of papers to download per topic
+        max_concurrency (int, optional): Maximum concurrent downloads. Defaults to 8.
+        dirpath (str, optional): Directory to save PDFs in. Defaults to current directory.
     
     Returns:
         list: List of downloaded PDF file paths
     """
     client = arxiv.Client()
-    downloaded_papers = []
+    papers = []
 
+    # Collect search results for every topic first (metadata only, cached on disk)
     for topic in topics:
-        search = arxiv.Search(
-            query=topic,
-            max_results=num_results_per_topic,
-            sort_by=arxiv.SortCriterion.SubmittedDate
-        )
-        results = client.results(search)
+        papers.extend(await asyncio.to_thread(
+            cached_search, client, topic, num_results_per_topic, arxiv.SortCriterion.SubmittedDate
+        ))
+
+    # Then stream all PDFs concurrently over one pooled HTTP/2 client
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limits = httpx.Limits(max_connections=16, keepalive_expiry=60)
+
+    async with httpx.AsyncClient(http2=True, follow_redirects=True, timeout=60.0, limits=limits) as http_client:
+        async def download(paper):
+            # Old-style arxiv ids contain a slash, e.g. "hep-th/9901001v1"
+            short_id = paper["entry_id"].split("/abs/")[-1]
+            pdf_path = os.path.join(dirpath, f"{short_id.replace('/', '_')}.pdf")
+            async with semaphore:
+                async with http_client.stream("GET", paper["pdf_url"]) as response:
+                    response.raise_for_status()
+                    # File writes go to a worker thread so the loop keeps serving other downloads
+                    f = await asyncio.to_thread(open, pdf_path, "wb")
+                    try:
+                        async for chunk in response.aiter_bytes(65536):
+                            await asyncio.to_thread(f.write, chunk)
+                    finally:
+                        await asyncio.to_thread(f.close)
+            return pdf_path
+
+        async def try_download(paper):
+            try:
+                return await download(paper)
+            except (httpx.HTTPError, OSError) as e:
+                logger.warning(f"Failed to download {paper['title']}: {e}")
+                return None
 
-        for r in results:
-            pdf_path = r.download_pdf()
-            downloaded_papers.append(pdf_path)
+        # Papers without a PDF link are skipped; one failed download does not abort the rest
+        downloadable = [paper for paper in papers if paper.get("pdf_url")]
+        results = await asyncio.gather(*(try_download(paper) for paper in downloadable))
+        downloaded_papers = [pdf_path for pdf_path in results if pdf_path is not None]
 
     return downloaded_papers
 
@@ -39,5 +110,6 @@ def list_pdf_files(directory='.'):
     Returns:
         list: List of PDF file names
     """
-    pdf_files = [file.name for file in Path(directory).glob('*.pdf')]
+    with os.scandir(directory) as entries:
+        pdf_files = [entry.name for entry in entries if entry.name.endswith('.pdf')]
     return pdf_files
\ No newline at end of file
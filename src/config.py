@@ -10,4 +10,7 @@ LLAMA_CLOUD_API_KEY = os.getenv('LLAMA_CLOUD_API_KEY')
 
 # Research Configuration
 RESEARCH_PAPER_TOPICS = ["quantum computing application in healthcare"]
-NUM_RESULTS_PER_TOPIC = 3
\ No newline at end of file
+NUM_RESULTS_PER_TOPIC = 3
+
+# Local cache directory for on-disk caches
+CACHE_DIR = "cache"
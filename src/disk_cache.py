@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from src.config import CACHE_DIR
+
+def cache_path(namespace, key, suffix=".json"):
+    """
+    Build the path of a cache entry
+    
+    Args:
+        namespace (str): Subdirectory of the cache directory
+        key (str): Cache key, typically a content hash
+        suffix (str, optional): File suffix. Defaults to ".json".
+    
+    Returns:
+        Path: Path of the cache file
+    """
+    return Path(CACHE_DIR) / namespace / f"{key}{suffix}"
+
+def is_fresh(path, max_age):
+    """
+    Check whether a cache entry exists and was written less than max_age seconds ago
+    
+    Args:
+        path (Path): Path of the cache file
+        max_age (float): Maximum age in seconds
+    
+    Returns:
+        bool: True if the entry is fresh
+    """
+    try:
+        return time.time() - path.stat().st_mtime < max_age
+    except OSError:
+        return False
+
+def read_json(path):
+    """
+    Read a JSON cache entry
+    
+    Args:
+        path (Path): Path of the cache file
+    
+    Returns:
+        Any: Cached value, or None if the entry is missing or unreadable
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def read_bytes(path):
+    """
+    Read a binary cache entry
+    
+    Args:
+        path (Path): Path of the cache file
+    
+    Returns:
+        bytes: Cached content, or None if the entry is missing or unreadable
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _atomic_write(path, mode, write):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file in the same directory, then swap it in
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            write(f)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def write_json(path, data):
+    """
+    Atomically write a JSON cache entry
+    
+    Args:
+        path (Path): Path of the cache file
+        data (Any): JSON-serializable value
+    """
+    _atomic_write(path, "w", lambda f: json.dump(data, f))
+
+def write_bytes(path, data):
+    """
+    Atomically write a binary cache entry
+    
+    Args:
+        path (Path): Path of the cache file
+        data (bytes): Content to store
+    """
+    _atomic_write(path, "wb", lambda f: f.write(data))
+
+def touch(path):
+    """Mark a cache entry as freshly validated without rewriting it"""
+    os.utime(path)
+
+def prune(namespace, max_entries):
+    """
+    Delete the oldest entries of a cache namespace beyond max_entries, by write time (FIFO)
+    
+    Args:
+        namespace (str): Subdirectory of the cache directory
+        max_entries (int): Number of entries to keep
+    """
+    try:
+        with os.scandir(Path(CACHE_DIR) / namespace) as entries:
+            files = [(entry.stat().st_mtime, entry.path) for entry in entries if entry.is_file()]
+    except OSError:
+        return
+    if len(files) <= max_entries:
+        return
+    files.sort()
+    for _, path in files[:len(files) - max_entries]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
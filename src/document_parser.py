@@ -1,61 +1,72 @@
 from llama_parse import LlamaParse
+import asyncio
+import functools
 import tempfile
 import os
 
-def parse_pdf_files(pdf_files, result_type="markdown", num_workers=4):
+@functools.lru_cache(maxsize=4)
+def get_parser(result_type, num_workers):
     """
-    Parse PDF files using LlamaParse, handling both file paths and BytesIO objects
+    Get a shared LlamaParse instance for the given settings
     
     Args:
-        pdf_files (list): List of PDF file paths or BytesIO objects
-        result_type (str, optional): Parse result type. Defaults to "markdown".
-        num_workers (int, optional): Number of workers for parsing. Defaults to 4.
+        result_type (str): Parse result type
+        num_workers (int): Number of concurrent parse requests
     
     Returns:
-        list: Parsed documents
+        LlamaParse: Parser reused across calls with the same settings
     """
-    parser = LlamaParse(
+    return LlamaParse(
         result_type=result_type,
         num_workers=num_workers,
         verbose=True,
     )
 
-    documents = []
+async def parse_pdf_files(pdf_files, result_type="markdown", num_workers=4):
+    """
+    Parse PDF files concurrently using LlamaParse, handling both file paths and BytesIO objects
+    
+    Args:
+        pdf_files (list): List of PDF file paths or BytesIO objects
+        result_type (str, optional): Parse result type. Defaults to "markdown".
+        num_workers (int, optional): Number of concurrent parse requests. Defaults to 4.
+    
+    Returns:
+        list: Parsed documents
+    """
+    parser = get_parser(result_type, num_workers)
+
     temp_files = []  # Keep track of temporary files to delete later
+    semaphore = asyncio.Semaphore(num_workers)
 
     try:
-        for index, pdf_file in enumerate(pdf_files):
-            try:
-                # Check if pdf_file is a BytesIO object
-                if hasattr(pdf_file, "read"):
-                    # print(f"Processing BytesIO file {index + 1}/{len(pdf_files)}")
-                    
-                    # Create a temporary file
-                    temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-                    temp_path = temp.name
-                    temp_files.append(temp_path)  # Add to list for cleanup
-                    
-                    # Reset pointer and write content to temp file
-                    pdf_file.seek(0)
-                    temp.write(pdf_file.read())
-                    temp.close()
-                    
-                    # Parse the temporary file
-                    document = parser.load_data(temp_path)
-                    
-                else:
-                    # Handle as a regular file path
-                    # print(f"Processing file {index + 1}/{len(pdf_files)}: {pdf_file}")
-                    document = parser.load_data(pdf_file)
+        # Write BytesIO objects to temporary files up front
+        file_paths = []
+        for pdf_file in pdf_files:
+            if hasattr(pdf_file, "read"):
+                temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+                temp_files.append(temp.name)  # Add to list for cleanup
                 
-                documents.append(document)
-                # print(f"Successfully processed file {index + 1}")
-                
-            except Exception as e:
-                # print(f"Error processing file {index + 1}: {str(e)}")
-                continue
-                
-        return documents
+                # Reset pointer and write content to temp file
+                pdf_file.seek(0)
+                temp.write(pdf_file.read())
+                temp.close()
+                file_paths.append(temp.name)
+            else:
+                # Handle as a regular file path
+                file_paths.append(pdf_file)
+
+        async def load_one(file_path):
+            async with semaphore:
+                try:
+                    return await parser.aload_data(file_path)
+                except Exception as e:
+                    # Skip files that fail to parse
+                    return None
+
+        # Parse all files in parallel, keeping input order
+        results = await asyncio.gather(*(load_one(file_path) for file_path in file_paths))
+        return [document for document in results if document is not None]
         
     finally:
         # Clean up temporary files
@@ -63,4 +74,4 @@ def parse_pdf_files(pdf_files, result_type="markdown", num_workers=4):
             try:
                 os.unlink(temp_path)
             except:
-                pass
\ No newline at end of file
+                pass
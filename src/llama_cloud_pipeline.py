@@ -1,11 +1,20 @@
 import os
+import asyncio
+import hashlib
+import logging
 from llama_cloud.client import LlamaCloud
 from llama_cloud.types import CloudDocumentCreate
 from llama_index.llms.openai import OpenAI
-from llama_index.core.async_utils import run_jobs
 from llama_index.core.prompts import PromptTemplate
 from pydantic import BaseModel, Field
 from typing import List
+from src.disk_cache import cache_path
+from src.llm_cache import LLM_CACHE_MAX_ENTRIES, llm_once, prompt_hash, read_cached_response, write_cached_response
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on estimated tokens sent in one batch upload request
+MAX_BATCH_TOKENS = 200_000
 
 class Metadata(BaseModel):
     author_names: List[str] = Field(default_factory=list, description="List of author names")
@@ -39,9 +48,19 @@ def create_llamacloud_pipeline(pipeline_name, embedding_config, transform_config
     return client, pipeline
 
 
+async def _extract_metadata(llm, prompt, path):
+    # The Metadata schema replaces free-text JSON instructions; OpenAI function
+    # calling guarantees a well-formed result
+    structured_llm = llm.as_structured_llm(output_cls=Metadata)
+    response = await structured_llm.acomplete(prompt)
+    metadata = response.raw
+    await write_cached_response("metadata", path, metadata.model_dump(), LLM_CACHE_MAX_ENTRIES)
+    return metadata
+
 async def get_papers_metadata(llm, text):
     """
-    Extract metadata from research paper text
+    Extract metadata from research paper text, persisting results on disk by (model, prompt)
+    and coalescing identical concurrent calls
     
     Args:
         llm (OpenAI): Language model instance
@@ -50,26 +69,26 @@ async def get_papers_metadata(llm, text):
     Returns:
         Metadata: Extracted metadata
     """
-    prompt = f"""Generate authors names, authors companies, and general top 3 AI tags for the given research paper.
+    prompt = f"""Extract the author names, author companies, and general top 3 AI tags for this research paper:
 
-    Research Paper:
-    {text}
+    {text[:6000]}"""
 
-    Respond with a JSON that includes:
-    - author_names: List of author names
-    - author_companies: List of author companies
-    - ai_tags: List of 3 AI-related tags"""
+    key = hashlib.sha256((llm.model + prompt).encode()).hexdigest()
+    path = cache_path("metadata", key)
+    cached = await read_cached_response(path)
+    if cached is not None:
+        return Metadata(**cached)
 
-    response = await llm.acomplete(prompt)
-    
-    # You might need to parse the response manually
     try:
-        import json
-        parsed_response = json.loads(response.text)
-        return Metadata(**parsed_response)
+        return await llm_once(
+            ("metadata", llm.model, prompt_hash(prompt)),
+            lambda: _extract_metadata(llm, prompt, path)
+        )
     except Exception as e:
-        print(f"Error parsing metadata: {e}")
+        # Failures are not cached, so the next run retries extraction
+        logger.warning(f"Error extracting metadata: {e}")
         return Metadata()
+
 async def get_document_upload(document, llm):
     """
     Prepare document for cloud upload
@@ -81,7 +100,8 @@ async def get_document_upload(document, llm):
     Returns:
         CloudDocumentCreate: Prepared document for upload
     """
-    text_for_metadata_extraction = document[0].text + document[1].text + document[2].text
+    # Metadata lives at the start of the paper; only the first pages' leading text is needed
+    text_for_metadata_extraction = "".join(doc.text[:2000] for doc in document[:3])
     full_text = "\n\n".join([doc.text for doc in document])
     metadata = await get_papers_metadata(llm, text_for_metadata_extraction)
     return CloudDocumentCreate(
@@ -93,20 +113,50 @@ async def get_document_upload(document, llm):
         }
     )
 
-async def upload_documents(client, pipeline, documents, llm):
+def batch_by_tokens(documents, max_batch_tokens=MAX_BATCH_TOKENS):
     """
-    Upload documents to LlamaCloud
+    Group documents into batches whose estimated token count stays under a limit
     
     Args:
-        client (LlamaCloud): LlamaCloud client
-        pipeline (Pipeline): Created pipeline
-        documents (list): Documents to upload
-        llm (OpenAI): Language model instance
+        documents (list): CloudDocumentCreate objects to group
+        max_batch_tokens (int, optional): Token budget per batch. Defaults to MAX_BATCH_TOKENS.
+    
+    Returns:
+        list: Batches of documents, in their original order
     """
-    extract_jobs = []
+    batches = []
+    batch = []
+    batch_tokens = 0
     for document in documents:
-        extract_jobs.append(get_document_upload(document, llm))
+        # Roughly four characters per token
+        tokens = len(document.text) // 4
+        if batch and batch_tokens + tokens > max_batch_tokens:
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(document)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
 
-    document_upload_objs = await run_jobs(extract_jobs, workers=4)
-
-    _ = client.pipelines.create_batch_pipeline_documents(pipeline.id, request=document_upload_objs)
\ No newline at end of file
+async def create_documents_in_batches(client, pipeline, documents, max_batch_tokens=MAX_BATCH_TOKENS):
+    """
+    Create pipeline documents in token-bounded batches
+    
+    Args:
+        client (LlamaCloud): LlamaCloud client
+        pipeline (Pipeline): Created pipeline
+        documents (list): CloudDocumentCreate objects to upload
+        max_batch_tokens (int, optional): Token budget per batch. Defaults to MAX_BATCH_TOKENS.
+    
+    Returns:
+        list: Created cloud documents, in the same order as the input
+    """
+    cloud_documents = []
+    for batch in batch_by_tokens(documents, max_batch_tokens):
+        # The LlamaCloud client is blocking, so keep it off the event loop
+        cloud_documents.extend(await asyncio.to_thread(
+            client.pipelines.create_batch_pipeline_documents, pipeline.id, request=batch
+        ))
+    return cloud_documents
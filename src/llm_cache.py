@@ -0,0 +1,187 @@
+import asyncio
+import collections
+import hashlib
+from dataclasses import dataclass
+import streamlit as st
+from src.disk_cache import cache_path, is_fresh, read_json, write_json, prune
+
+# Disk-cached LLM and query engine responses older than this are regenerated
+RESPONSE_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Disk caches keep at most this many entries, evicting in write order (FIFO);
+# hits do not refresh an entry, since its mtime also drives the TTL
+LLM_CACHE_MAX_ENTRIES = 2048
+QUERY_CACHE_MAX_ENTRIES = 2048
+
+# Each namespace is pruned once every this many writes rather than after each one
+PRUNE_INTERVAL = 64
+
+# Query answers shorter than this are treated as rejections and never cached
+MIN_QUERY_ANSWER_LENGTH = 50
+
+def prompt_hash(prompt):
+    """
+    Compute a short content hash for a prompt
+    
+    Args:
+        prompt (str): Prompt text
+    
+    Returns:
+        str: Hex digest of the prompt
+    """
+    return hashlib.blake2b(prompt.encode()).hexdigest()
+
+# The LLM and prompt are excluded from Streamlit's hashing (leading underscore);
+# the cache is keyed on (model, prompt_hash) only
+@st.cache_data(ttl="6h", max_entries=512)
+def _cached_complete(_llm, model, prompt_hash, _prompt):
+    return _llm.complete(_prompt).text
+
+def complete_cached(llm, prompt):
+    """
+    Complete a prompt, reusing the response for identical (model, prompt) pairs
+    
+    Args:
+        llm (OpenAI): Language model instance
+        prompt (str): Prompt text
+    
+    Returns:
+        str: Completion text
+    """
+    return _cached_complete(llm, llm.model, prompt_hash(prompt), prompt)
+
+async def read_cached_response(path):
+    """
+    Read a disk-cached response off the event loop
+    
+    Args:
+        path (Path): Path of the cache file
+    
+    Returns:
+        Any: Cached value, or None if the entry is missing, unreadable or expired
+    """
+    def read():
+        return read_json(path) if is_fresh(path, RESPONSE_CACHE_TTL) else None
+    return await asyncio.to_thread(read)
+
+# Writes per cache namespace since it was last pruned
+_writes_since_prune = collections.Counter()
+
+async def write_cached_response(namespace, path, data, max_entries):
+    """
+    Write a disk-cached response off the event loop, pruning the namespace every PRUNE_INTERVAL writes
+    
+    Args:
+        namespace (str): Cache namespace the path belongs to
+        path (Path): Path of the cache file
+        data (Any): JSON-serializable value
+        max_entries (int): Number of entries the namespace keeps when pruned
+    """
+    await asyncio.to_thread(write_json, path, data)
+    _writes_since_prune[namespace] += 1
+    if _writes_since_prune[namespace] >= PRUNE_INTERVAL:
+        _writes_since_prune[namespace] = 0
+        await asyncio.to_thread(prune, namespace, max_entries)
+
+async def cached_acomplete(llm, prompt):
+    """
+    Complete a prompt asynchronously, persisting responses on disk by (model, prompt)
+    
+    Args:
+        llm (OpenAI): Language model instance
+        prompt (str): Prompt text
+    
+    Returns:
+        str: Completion text
+    """
+    key = hashlib.sha256((llm.model + prompt).encode()).hexdigest()
+    path = cache_path("llm", key)
+    cached = await read_cached_response(path)
+    if cached is not None:
+        return cached["text"]
+
+    response = await llm.acomplete(prompt)
+    await write_cached_response("llm", path, {"text": response.text}, LLM_CACHE_MAX_ENTRIES)
+    return response.text
+
+async def cached_aquery(query_engine, query, engine_name="", index_version=""):
+    """
+    Query the index asynchronously, persisting responses on disk by index, engine and query text
+    
+    Args:
+        query_engine: Query engine instance
+        query (str): Query text
+        engine_name (str, optional): Distinguishes engines with different retrieval settings. Defaults to "".
+        index_version (str, optional): Identifies the index and the documents uploaded to it,
+            so answers are not reused after its content changes. Defaults to "".
+    
+    Returns:
+        str: Response text
+    """
+    key = hashlib.sha256("\0".join((index_version, engine_name, query)).encode()).hexdigest()
+    path = cache_path("query", key)
+    cached = await read_cached_response(path)
+    if cached is not None:
+        return cached["text"]
+
+    text = str(await query_engine.aquery(query))
+    # Empty or short answers are retried on the next run instead of being pinned in the cache
+    if len(text.strip()) >= MIN_QUERY_ANSWER_LENGTH:
+        await write_cached_response("query", path, {"text": text}, QUERY_CACHE_MAX_ENTRIES)
+    return text
+
+@dataclass(slots=True)
+class _InflightCall:
+    """A shared call and the number of callers currently awaiting it"""
+    future: asyncio.Future
+    waiters: int = 0
+
+# LLM calls currently in flight, keyed by (model, prompt_hash)
+_inflight = {}
+
+def _forget(key, call):
+    # A newer call may already be registered under the same key
+    if _inflight.get(key) is call:
+        del _inflight[key]
+
+async def llm_once(key, coro_factory):
+    """
+    Run coro_factory() once for all concurrent callers sharing the same key.
+    The shared call is cancelled once every caller awaiting it has been cancelled.
+    
+    Args:
+        key (hashable): Identity of the call, e.g. (model, prompt_hash)
+        coro_factory (callable): Returns the coroutine to run on a miss
+    
+    Returns:
+        Any: Result of the shared coroutine
+    """
+    call = _inflight.get(key)
+    if call is None:
+        call = _InflightCall(asyncio.ensure_future(coro_factory()))
+        _inflight[key] = call
+        call.future.add_done_callback(lambda _: _forget(key, call))
+    call.waiters += 1
+    try:
+        # Shield so one cancelled caller does not cancel the call for the others
+        return await asyncio.shield(call.future)
+    finally:
+        call.waiters -= 1
+        if call.waiters == 0 and not call.future.done():
+            # Every caller is gone; stop the request and let a later caller start afresh
+            _forget(key, call)
+            call.future.cancel()
+
+async def acomplete_once(llm, prompt):
+    """
+    Complete a prompt through the disk cache, coalescing identical concurrent calls
+    
+    Args:
+        llm (OpenAI): Language model instance
+        prompt (str): Prompt text
+    
+    Returns:
+        str: Completion text
+    """
+    key = (llm.model, prompt_hash(prompt))
+    return await llm_once(key, lambda: cached_acomplete(llm, prompt))
@@ -0,0 +1,68 @@
+import asyncio
+import httpx
+from llama_index.llms.openai import OpenAI
+
+# Pool limits for the HTTP/2 connections shared by all OpenAI calls
+OPENAI_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+# Sync calls from worker threads share one client; async clients are tied to their event loop
+_http_client = None
+_async_http_clients = {}
+
+def get_http_client():
+    """
+    Get the pooled HTTP/2 client shared by blocking OpenAI calls
+    
+    Returns:
+        httpx.Client: Shared client
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(http2=True, limits=OPENAI_POOL_LIMITS)
+    return _http_client
+
+async def _close_on_shutdown(loop, client):
+    # Parked until the loop cancels its remaining tasks on shutdown (as asyncio.run does)
+    try:
+        await loop.create_future()
+    finally:
+        _async_http_clients.pop(loop, None)
+        await client.aclose()
+
+def get_async_http_client():
+    """
+    Get the pooled HTTP/2 client shared by async OpenAI calls on the running event loop.
+    The client is closed when the loop shuts down.
+    
+    Returns:
+        httpx.AsyncClient: Client reused for every call on this loop, or None outside a running loop
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    entry = _async_http_clients.get(loop)
+    if entry is None:
+        client = httpx.AsyncClient(http2=True, limits=OPENAI_POOL_LIMITS)
+        # Keep a reference to the closer task so it is not garbage collected
+        entry = (client, loop.create_task(_close_on_shutdown(loop, client)))
+        _async_http_clients[loop] = entry
+    return entry[0]
+
+def create_llm(**kwargs):
+    """
+    Create an OpenAI LLM that sends its requests over the shared connection pools.
+    Outside a running event loop the async client is left to the OpenAI SDK,
+    since an async connection pool cannot be shared across loops.
+    
+    Args:
+        **kwargs: Arguments for llama_index's OpenAI (api_key, model, temperature, ...)
+    
+    Returns:
+        OpenAI: Language model instance
+    """
+    return OpenAI(
+        http_client=get_http_client(),
+        async_http_client=get_async_http_client(),
+        **kwargs
+    )
@@ -1,30 +1,51 @@
+import functools
 from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
 
-def create_query_engine(api_key, index_name="report_generation", project_name="Default"):
+# The API key is part of the cache key, so callers with different credentials never share an index
+@functools.lru_cache(maxsize=8)
+def get_cloud_index(api_key, index_name="report_generation", project_name="Default"):
     """
-    Create a query engine for the LlamaCloud index
-    
+    Connect to a LlamaCloud index, reused for repeated calls with the same arguments
+
     Args:
         api_key (str): LlamaCloud API key
         index_name (str, optional): Name of the index. Defaults to "report_generation".
         project_name (str, optional): Project name. Defaults to "Default".
-    
+
     Returns:
-        QueryEngine: Configured query engine
+        LlamaCloudIndex: Connected index
     """
-    index = LlamaCloudIndex(
+    return LlamaCloudIndex(
         name=index_name,
         project_name=project_name,
         api_key=api_key
     )
 
+@functools.lru_cache(maxsize=8)
+def create_query_engine(api_key, index_name="report_generation", project_name="Default", *, enable_reranking=True, rerank_top_n=5, top_k=10):
+    """
+    Create a query engine for the LlamaCloud index, reused for repeated calls with the same arguments
+
+    Args:
+        api_key (str): LlamaCloud API key
+        index_name (str, optional): Name of the index. Defaults to "report_generation".
+        project_name (str, optional): Project name. Defaults to "Default".
+        enable_reranking (bool, optional): Rerank retrieved chunks. Defaults to True.
+        rerank_top_n (int, optional): Chunks kept after reranking. Defaults to 5.
+        top_k (int, optional): Chunks retrieved by dense and by sparse search. Defaults to 10.
+
+    Returns:
+        QueryEngine: Configured query engine
+    """
+    index = get_cloud_index(api_key, index_name, project_name)
+
     query_engine = index.as_query_engine(
-        dense_similarity_top_k=10,
-        sparse_similarity_top_k=10,
+        dense_similarity_top_k=top_k,
+        sparse_similarity_top_k=top_k,
         alpha=0.5,
-        enable_reranking=True,
-        rerank_top_n=5,
+        enable_reranking=enable_reranking,
+        rerank_top_n=rerank_top_n,
         retrieval_mode="chunks"
     )
 
-    return query_engine
\ No newline at end of file
+    return query_engine
@@ -1,71 +1,202 @@
+import asyncio
+import json
+import random
 import re
-from typing import Any, Dict, List
+import openai
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Dict, List, Optional
 from llama_index.llms.openai import OpenAI
 from llama_index.core.llms.function_calling import FunctionCallingLLM
 from llama_index.core.workflow import Workflow, StartEvent, StopEvent, Context, step
 from llama_index.core.workflow import Event
+from src.llm_cache import acomplete_once, cached_aquery, complete_cached
+
+# Classifies an outline line in one match: a "## " section heading with an optional
+# number (e.g. "## 2. Fundamentals") or a numbered subsection (e.g. "2.1. Basics")
+OUTLINE_LINE_RE = re.compile(
+    r'^(?:## [#\s]*(?P<section>(?:(?P<section_number>\d+\.)\s*)?(?P<section_title>.*?))[#\s]*'
+    r'|(?P<subsection_number>\d+\.\d+)(?:\.\s*|\s+)(?P<subsection_title>.*))$'
+)
+
+# Errors worth retrying: rate limits and transient network failures
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)
+
+async def with_backoff(make_call, max_retries=3, semaphore=None):
+    """Await make_call(), retrying rate limits and transient errors with exponential backoff.
+    The semaphore, if given, is held only while a call is in flight, not while backing off."""
+    for attempt in range(max_retries):
+        try:
+            async with semaphore or nullcontext():
+                return await make_call()
+        except RETRYABLE_ERRORS:
+            if attempt == max_retries - 1:
+                raise
+            # Exponential backoff with jitter, capped at 30 seconds
+            await asyncio.sleep(min(2 ** attempt, 30) + random.uniform(0, 1))
+
+# Parses a combined "QUERY: ... / CLASSIFICATION: ..." response
+CLASSIFIED_QUERY_RE = re.compile(r'QUERY:\s*(?P<query>.+?)\s*\n\s*CLASSIFICATION:\s*(?P<classification>LLM|INDEX)', re.S | re.I)
+
+# Keyword heuristics for classifying queries without asking the LLM
+INDEX_QUERY_RE = re.compile(r'\b(?:recent|latest|current|20\d\d|statistics?|market size|case stud(?:y|ies)|news)\b', re.I)
+LLM_QUERY_RE = re.compile(r'\b(?:what is|define|explain|overview of|concept of|introduction to)\b', re.I)
+
+# Comparisons and time-sensitive queries need the wider, reranked retrieval
+COMPLEX_QUERY_RE = re.compile(r'\b(?:compar\w*|versus|vs\.?|trade-?offs?|recent|latest|current|20\d\d)\b', re.I)
+
+# Matches the outermost JSON array or object in an LLM response
+JSON_ARRAY_RE = re.compile(r'\[.*\]', re.S)
+JSON_OBJECT_RE = re.compile(r'\{.*\}', re.S)
 
 def extract_title(outline):
     """Function to extract the title from the first line of the outline"""
     first_line = outline.strip().split('\n')[0]
     return first_line.strip('# ').strip()
 
-def generate_query_with_llm(llm, title, section, subsection):
-    """Function to generate a query for a report using LLM"""
-    prompt = f"Generate a research query for a report on {title}. "
-    prompt += f"The query should be for the subsection '{subsection}' under the main section '{section}'. "
-    prompt += "The query should guide the research to gather relevant information for this part of the report. The query should be clear, short and concise. "
+def fast_classify(query) -> Optional[str]:
+    """Function to classify a query as 'LLM' or 'INDEX' from keywords alone, or None if no rule applies"""
+    if INDEX_QUERY_RE.search(query):
+        return "INDEX"
+    if LLM_QUERY_RE.search(query):
+        return "LLM"
+    return None
 
-    response = llm.complete(prompt)
-    return str(response).strip()
+def is_simple_query(query):
+    """Function to tell whether an index query is a simple lookup that can skip reranking"""
+    if COMPLEX_QUERY_RE.search(query):
+        return False
+    return bool(LLM_QUERY_RE.search(query)) or len(query.split()) <= 12
 
-def classify_query(llm, query):
-    """Function to classify the query as either 'LLM' or 'INDEX' based on the query content"""
-    prompt = f"""Classify the following query as either "LLM" if it can be answered directly by a large language model with general knowledge, or "INDEX" if it likely requires querying an external index or database for specific or up-to-date information.
+def generate_classified_query(llm, title, section, subsection):
+    """Function to generate a query for a report and classify it as 'LLM' or 'INDEX' in a single LLM call"""
+    prompt = f"""Generate a research query for a report on {title}, then classify it.
+    The query should be for the subsection '{subsection}' under the main section '{section}'.
+    The query should guide the research to gather relevant information for this part of the report. The query should be clear, short and concise.
 
-    Query: "{query}"
-
-    Consider the following:
+    Classify the query as "LLM" if it can be answered directly by a large language model with general knowledge, or "INDEX" if it likely requires querying an external index or database for specific or up-to-date information:
     1. If the query asks for general knowledge, concepts, or explanations, classify as "LLM".
     2. If the query asks for specific facts, recent events, or detailed information that might not be in the LLM's training data, classify as "INDEX".
     3. If unsure, err on the side of "INDEX".
 
-    Classification:"""
+    Respond exactly as:
+    QUERY: <query>
+    CLASSIFICATION: <LLM or INDEX>"""
 
-    classification = str(llm.complete(prompt)).strip().upper()
-    if classification not in ["LLM", "INDEX"]:
-        classification = "INDEX"  # Default to INDEX if the response is unclear
-    return classification
+    response = complete_cached(llm, prompt)
+    match = CLASSIFIED_QUERY_RE.search(response)
+    if match is None:
+        # Classify by keywords, defaulting to INDEX if the response is unclear
+        query = response.replace("QUERY:", "").strip()
+        return {"query": query, "classification": fast_classify(query) or "INDEX"}
+    return {"query": match['query'].strip(), "classification": match['classification'].upper()}
 
-def parse_outline_and_generate_queries(llm, outline):
-    """Function to parse the outline and generate queries for each section and subsection"""
+def generate_queries_batch(llm, title, section, subsections, max_batch_size=12):
+    """Function to generate and classify queries for several subsections of a section in one LLM call"""
+    results = []
+    for start in range(0, len(subsections), max_batch_size):
+        batch = subsections[start:start + max_batch_size]
+        listing = "\n".join(f"{i + 1}. {subsection}" for i, subsection in enumerate(batch))
+        prompt = f"""For each subsection listed at the end, generate a research query for a report and classify it.
+    The query should guide the research to gather relevant information for that part of the report, and be clear, short and concise.
+    Classify the query as "LLM" if it can be answered directly by a large language model with general knowledge, or "INDEX" if it likely requires querying an external index or database for specific or up-to-date information. If unsure, use "INDEX".
+
+    Respond with only a JSON array with one object per subsection, in the same order:
+    [{{"subsection": "...", "query": "...", "classification": "LLM" or "INDEX"}}]
+
+    Report: {title}
+    Main section: {section}
+    Subsections:
+    {listing}"""
+
+        # API errors propagate; only a malformed reply falls back to per-subsection calls
+        response = complete_cached(llm, prompt)
+        try:
+            items = json.loads(JSON_ARRAY_RE.search(response).group(0))
+            if len(items) != len(batch):
+                raise ValueError("Batch response does not match the number of subsections")
+            batch_results = []
+            for item in items:
+                query = str(item["query"]).strip()
+                classification = str(item.get("classification", "")).strip().upper()
+                if classification not in ["LLM", "INDEX"]:
+                    # Classify by keywords, defaulting to INDEX if the response is unclear
+                    classification = fast_classify(query) or "INDEX"
+                batch_results.append({"query": query, "classification": classification})
+        except (ValueError, KeyError, TypeError, AttributeError):
+            # Fall back to one combined query and classification call per subsection
+            batch_results = [generate_classified_query(llm, title, section, subsection) for subsection in batch]
+        results.extend(batch_results)
+    return results
+
+@dataclass(slots=True)
+class OutlineSubsection:
+    """A numbered subsection line of the outline"""
+    key: str  # Key of the subsection in the generated queries and contents
+    number: str
+    title: str
+
+@dataclass(slots=True)
+class OutlineSection:
+    """A "## " section of the outline with its subsections"""
+    key: str  # Key of the section in the generated queries and contents
+    number: str
+    title: str
+    subsections: List[OutlineSubsection] = field(default_factory=list)
+
+def parse_outline_structure(outline):
+    """Function to parse the outline once into its title and section/subsection structure"""
     lines = outline.strip().split('\n')
     title = extract_title(outline)
-    current_section = ""
-    queries = {}
+    sections = []
+    current_section = None
 
     for line in lines[1:]:  # Skip the title line
         line = line.strip()
         if not line:  # Skip empty lines
             continue
         
-        if line.startswith('## '):
-            current_section = line.strip('# ').strip()
-            queries[current_section] = {}
-        elif re.match(r'^\d+\.\d+\.', line) or re.match(r'^\d+\.\d+\s', line):
-            subsection = line.strip()
-            query = generate_query_with_llm(llm, title, current_section, subsection)
-            classification = classify_query(llm, query)
-            queries[current_section][subsection] = {"query": query, "classification": classification}
+        match = OUTLINE_LINE_RE.match(line)
+        if match is None:
+            continue
+        
+        # Section line (e.g., "## 2. Blockchain Fundamentals")
+        if match['section'] is not None:
+            current_section = OutlineSection(
+                key=match['section'].rstrip(),
+                # Handle section without number
+                number=match['section_number'] or str(len(sections) + 1) + ".",
+                title=match['section_title'] if match['section_number'] else match['section'],
+            )
+            sections.append(current_section)
+        
+        # Subsection line (e.g., "2.1. Basics of Blockchain Technology")
+        elif current_section is not None:
+            current_section.subsections.append(OutlineSubsection(
+                key=line,
+                number=match['subsection_number'] + ".",
+                title=match['subsection_title']
+            ))
 
-    # Handle sections without subsections
-    for section in queries:
-        if not queries[section]:
-            query = generate_query_with_llm(llm, title, section, "General overview")
-            classification = classify_query(llm, query)
-            queries[section]["General"] = {"query": query, "classification": classification}
+    return title, sections
 
-    return queries, title
+def parse_outline_and_generate_queries(llm, outline):
+    """Function to parse the outline and generate queries for each section and subsection"""
+    title, sections = parse_outline_structure(outline)
+
+    # Generate all queries of a section in one batched call
+    queries = {}
+    for section in sections:
+        subsections = [subsection.key for subsection in section.subsections]
+        if subsections:
+            batch = generate_queries_batch(llm, title, section.key, subsections)
+            queries[section.key] = dict(zip(subsections, batch))
+        else:
+            # Handle sections without subsections
+            queries[section.key] = {"General": generate_classified_query(llm, title, section.key, "General overview")}
+
+    return queries, title, sections
 
 
 class ReportGenerationEvent(Event):
@@ -79,12 +210,22 @@ class ReportGenerationAgent(Workflow):
         self,
         query_engine: Any,
         llm: FunctionCallingLLM | None = None,
+        max_concurrency: int = 10,
+        fast_query_engine: Any = None,
+        index_version: str = "",
         **kwargs: Any,
     ) -> None:
         super().__init__(**kwargs)
         self.query_engine = query_engine
+        # Optional engine without reranking, used for simple lookups
+        self.fast_query_engine = fast_query_engine
+        # Identifies the indexed documents, so cached query answers follow index changes
+        self.index_version = index_version
         self.llm = llm or OpenAI(model='gpt-3.5-turbo')
         self.debug = kwargs.get('verbose', False)
+        # Bounds concurrent LLM and query engine calls to respect API rate limits
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
 
     def log(self, message):
         """Print debug messages if verbose mode is enabled"""
@@ -92,136 +233,171 @@ class ReportGenerationAgent(Workflow):
             pass
             # print(f"[ReportAgent] {message}")
 
-    def format_report(self, section_contents, title, outline):
-        """Format the report based on the section contents."""
-        # Extract structure from outline
-        sections = self._parse_outline_structure(outline)
-        
-        # self.log(f"Formatting report with title: {title}")
-        # self.log(f"Found {len(sections)} sections in outline")
+    def _start_generation_tasks(self, queries, title, sections):
+        """Start section content generation and every LLM call the formatted report needs.
+        Overviews start as soon as their section is written, and the introduction and conclusion
+        as soon as the sections their snippets come from are done."""
+        content_tasks = {
+            section_key: asyncio.create_task(self._generate_section_content(section_key, subsection_queries))
+            for section_key, subsection_queries in queries.items()
+        }
+        tasks = {('content', section_key): task for section_key, task in content_tasks.items()}
+        
+        # _with_backoff takes the semaphore and retries transient errors
+        async def overview(section_key):
+            prompt = self._section_overview_prompt(section_key, await content_tasks[section_key])
+            return await self._with_backoff(lambda: acomplete_once(self.llm, prompt))
+        
+        async def report_part(kind, generate):
+            topics, snippets = await self._collect_report_context(content_tasks, kind)
+            return await self._with_backoff(lambda: generate(title, topics, snippets))
+        
+        # Placeholders don't depend on generated content, so they are batched and started right away
+        placeholder_prompts = {}
+        for section_info in sections:
+            section_title = section_info.title
+            section_key = section_info.key
+            
+            if "introduction" in section_title.lower():
+                if ('introduction',) not in tasks:
+                    tasks[('introduction',)] = asyncio.create_task(report_part("introduction", self._generate_introduction))
+            elif "conclusion" in section_title.lower():
+                if ('conclusion',) not in tasks:
+                    tasks[('conclusion',)] = asyncio.create_task(report_part("conclusion", self._generate_conclusion))
+            elif section_key in queries:
+                if section_info.subsections:
+                    tasks[('overview', section_key)] = asyncio.create_task(overview(section_key))
+                for subsection in section_info.subsections:
+                    if subsection.key not in queries[section_key]:
+                        placeholder_prompts[('placeholder', section_key, subsection.key)] = self._placeholder_prompt(
+                            title, section_title, subsection.title
+                        )
+            else:
+                placeholder_prompts[('placeholder', section_key, "")] = self._placeholder_prompt(
+                    title, section_title, ""
+                )
+        
+        if placeholder_prompts:
+            batch_task = asyncio.create_task(self._generate_batch(placeholder_prompts))
+            # Tracked with the others so it is cancelled along with them
+            tasks[('batch',)] = batch_task
+            
+            async def batched_text(key):
+                return (await batch_task)[key]
+            
+            for key in placeholder_prompts:
+                tasks[key] = asyncio.create_task(batched_text(key))
         
-        # Start with the title
-        report = f"# {title}\n\n"
+        return tasks
+
+    async def format_report(self, queries, title, sections):
+        """Generate the section contents and format the report following the parsed outline sections."""
+        tasks = self._start_generation_tasks(queries, title, sections)
         
-        # Process each section in order according to the outline
-        for section_info in sections:
-            section_num = section_info['number']
-            section_title = section_info['title']
-            section_key = f"{section_num} {section_title}"
+        try:
+            # self.log(f"Formatting report with title: {title}")
+            # self.log(f"Found {len(sections)} sections in outline")
             
-            # self.log(f"Processing section: {section_key}")
+            # Start with the title; parts are joined once at the end
+            parts = [f"# {title}\n\n"]
             
-            # Check if this is an introduction or conclusion section
-            is_intro = "introduction" in section_title.lower()
-            is_conclusion = "conclusion" in section_title.lower()
+            # Process each section in order according to the outline
+            for section_info in sections:
+                section_num = section_info.number
+                section_title = section_info.title
+                section_key = section_info.key
             
-            if is_intro:
-                # self.log("Generating introduction")
-                # Generate introduction based on overall report content
-                intro_content = self._generate_introduction(title, section_contents)
-                report += f"## {section_num} {section_title}\n\n{intro_content}\n\n"
-            elif is_conclusion:
-                # self.log("Generating conclusion")
-                # Generate conclusion based on overall report content
-                conclusion_content = self._generate_conclusion(title, section_contents)
-                report += f"## {section_num} {section_title}\n\n{conclusion_content}\n\n"
-            else:
-                # Regular section
-                if section_key in section_contents:
-                    # Add section heading
-                    report += f"## {section_num} {section_title}\n\n"
+                # self.log(f"Processing section: {section_key}")
+            
+                # Check if this is an introduction or conclusion section
+                is_intro = "introduction" in section_title.lower()
+                is_conclusion = "conclusion" in section_title.lower()
+            
+                if is_intro:
+                    # self.log("Generating introduction")
+                    # Generate introduction based on overall report content
+                    intro_content = await tasks[('introduction',)]
+                    parts.append(f"## {section_num} {section_title}\n\n{intro_content}\n\n")
+                elif is_conclusion:
+                    # self.log("Generating conclusion")
+                    # Generate conclusion based on overall report content
+                    conclusion_content = await tasks[('conclusion',)]
+                    parts.append(f"## {section_num} {section_title}\n\n{conclusion_content}\n\n")
+                else:
+                    # Regular section
+                    if section_key in queries:
+                        section_content = await tasks[('content', section_key)]
+                        
+                        # Add section heading
+                        parts.append(f"## {section_num} {section_title}\n\n")
                     
-                    # Generate section overview if needed
-                    if len(section_info.get('subsections', [])) > 0:
-                        overview = self._generate_section_overview(section_key, section_contents[section_key])
-                        report += f"{overview}\n\n"
+                        # Generate section overview if needed
+                        if section_info.subsections:
+                            overview = await tasks[('overview', section_key)]
+                            parts.append(f"{overview}\n\n")
                     
-                    # Process subsections in order
-                    for subsection in section_info.get('subsections', []):
-                        subsection_num = subsection['number']
-                        subsection_title = subsection['title']
-                        subsection_key = f"{subsection_num} {subsection_title}"
+                        # Process subsections in order
+                        for subsection in section_info.subsections:
+                            subsection_num = subsection.number
+                            subsection_title = subsection.title
+                            subsection_key = subsection.key
                         
-                        # self.log(f"  Processing subsection: {subsection_key}")
+                            # self.log(f"  Processing subsection: {subsection_key}")
                         
-                        # Add content if available
-                        if subsection_key in section_contents[section_key]:
-                            content = section_contents[section_key][subsection_key]
-                            report += f"### {subsection_num} {subsection_title}\n\n{content}\n\n"
-                        else:
-                            # self.log(f"  Warning: No content for subsection {subsection_key}")
-                            # Generate placeholder content
-                            placeholder = self._generate_placeholder_content(title, section_title, subsection_title)
-                            report += f"### {subsection_num} {subsection_title}\n\n{placeholder}\n\n"
-                else:
-                    # self.log(f"Warning: No content for section {section_key}")
-                    # Generate placeholder
-                    placeholder = self._generate_placeholder_content(title, section_title, "")
-                    report += f"## {section_num} {section_title}\n\n{placeholder}\n\n"
-        
-        return report
-
-    def _parse_outline_structure(self, outline):
-        """Parse the outline to extract section and subsection structure"""
-        lines = outline.strip().split('\n')
-        sections = []
-        current_section = None
-        
-        for line in lines[1:]:  # Skip title
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Section line (e.g., "## 2. Blockchain Fundamentals")
-            if line.startswith('## '):
-                section_text = line.strip('# ').strip()
-                section_match = re.match(r'^(\d+\.)\s*(.*)$', section_text)
-                if section_match:
-                    section_num, section_title = section_match.groups()
-                    current_section = {
-                        'number': section_num,
-                        'title': section_title,
-                        'subsections': []
-                    }
-                    sections.append(current_section)
-                else:
-                    # Handle section without number
-                    current_section = {
-                        'number': str(len(sections) + 1) + ".",
-                        'title': section_text,
-                        'subsections': []
-                    }
-                    sections.append(current_section)
+                            # Add content if available
+                            if subsection_key in section_content:
+                                content = section_content[subsection_key]
+                                parts.append(f"### {subsection_num} {subsection_title}\n\n{content}\n\n")
+                            else:
+                                # self.log(f"  Warning: No content for subsection {subsection_key}")
+                                # Generate placeholder content
+                                placeholder = await tasks[('placeholder', section_key, subsection_key)]
+                                parts.append(f"### {subsection_num} {subsection_title}\n\n{placeholder}\n\n")
+                    else:
+                        # self.log(f"Warning: No content for section {section_key}")
+                        # Generate placeholder
+                        placeholder = await tasks[('placeholder', section_key, "")]
+                        parts.append(f"## {section_num} {section_title}\n\n{placeholder}\n\n")
+            
+            return "".join(parts)
+        finally:
+            # Don't leave generation calls running if formatting fails or is cancelled;
+            # llm_once cancels a shared call once none of its callers are waiting
+            for task in tasks.values():
+                task.cancel()
+
+    async def _collect_report_context(self, content_tasks, kind):
+        """Collect the topics and up to 5 content snippets for the introduction or conclusion,
+        awaiting only the sections the snippets are taken from"""
+        topics, snippets = [], []
+        for section, task in content_tasks.items():
+            section_lower = section.lower()
+            is_intro = "introduction" in section_lower
+            is_conclusion = "conclusion" in section_lower
+            if kind == "introduction":
+                # First 2 subsections of every section but the introduction
+                takes_topic, takes_snippets, per_section = not is_intro, not is_intro, 2
+            else:
+                # First subsection of every section but the conclusion
+                takes_topic, takes_snippets, per_section = not (is_intro or is_conclusion), not is_conclusion, 1
             
-            # Subsection line (e.g., "2.1. Basics of Blockchain Technology")
-            elif current_section and (re.match(r'^\d+\.\d+\.', line) or re.match(r'^\d+\.\d+\s', line)):
-                subsection_match = re.match(r'^(\d+\.\d+)\.?\s*(.*)$', line)
-                if subsection_match:
-                    subsection_num, subsection_title = subsection_match.groups()
-                    current_section['subsections'].append({
-                        'number': subsection_num + ".",
-                        'title': subsection_title
-                    })
-        
-        return sections
-
-    def _generate_introduction(self, title, section_contents):
+            if takes_topic:
+                # Topic names come from the outline, so they need no generated content
+                topics.append(section.split(" ", 1)[-1])
+            # Limit the amount of context to avoid token limits
+            if takes_snippets and len(snippets) < 5:
+                snippets.extend(islice((await task).values(), per_section))
+        
+        return topics, snippets[:5]
+
+    async def _generate_introduction(self, title, topics, content_snippets):
         """Generate introduction for the report"""
-        # Extract content snippets from each section to inform the introduction
-        content_snippets = []
-        for section, subsections in section_contents.items():
-            if not "introduction" in section.lower():
-                # Get a sample from each section
-                samples = list(subsections.values())[:2]  # Limit to first 2 subsections
-                content_snippets.extend(samples)
-        
-        # Limit the amount of context to avoid token limits
-        context = "\n".join(content_snippets[:5])  # Limit to 5 snippets
+        context = "\n".join(content_snippets)
         
         prompt = f"""Write a thorough introduction for a research paper titled "{title}".
         
         The paper covers the following topics:
-        {", ".join([s.split(" ", 1)[1] for s in section_contents.keys() if not "introduction" in s.lower()])}
+        {", ".join(topics)}
         
         Based on these topics and the following content samples:
         {context}
@@ -234,26 +410,17 @@ class ReportGenerationAgent(Workflow):
         
         Keep the introduction comprehensive yet concise."""
         
-        introduction = str(self.llm.complete(prompt))
+        introduction = await acomplete_once(self.llm, prompt)
         return introduction
 
-    def _generate_conclusion(self, title, section_contents):
+    async def _generate_conclusion(self, title, topics, content_snippets):
         """Generate conclusion for the report"""
-        # Extract content snippets from each section to inform the conclusion
-        content_snippets = []
-        for section, subsections in section_contents.items():
-            if not "conclusion" in section.lower():
-                # Get a sample from each section
-                samples = list(subsections.values())[:1]  # Limit to first subsection
-                content_snippets.extend(samples)
-        
-        # Limit the amount of context to avoid token limits
-        context = "\n".join(content_snippets[:5])  # Limit to 5 snippets
+        context = "\n".join(content_snippets)
         
         prompt = f"""Write a thorough conclusion for a research paper titled "{title}".
         
         The paper covered the following topics:
-        {", ".join([s.split(" ", 1)[1] for s in section_contents.keys() if not "conclusion" in s.lower() and not "introduction" in s.lower()])}
+        {", ".join(topics)}
         
         Based on these topics and the following content samples:
         {context}
@@ -266,15 +433,15 @@ class ReportGenerationAgent(Workflow):
         
         The conclusion should be thorough and thoughtful."""
         
-        conclusion = str(self.llm.complete(prompt))
+        conclusion = await acomplete_once(self.llm, prompt)
         return conclusion
 
-    def _generate_section_overview(self, section, subsection_contents):
-        """Generate an overview for a section based on its subsections"""
+    def _section_overview_prompt(self, section, subsection_contents):
+        """Build the prompt for an overview of a section based on its subsections"""
         # Compile brief snippets from each subsection
         subsection_samples = "\n".join([
             f"{sub_key}: {sub_content[:200]}..." 
-            for sub_key, sub_content in list(subsection_contents.items())[:3]
+            for sub_key, sub_content in islice(subsection_contents.items(), 3)
         ])
         
         section_title = section.split(" ", 1)[1] if " " in section else section
@@ -290,11 +457,10 @@ class ReportGenerationAgent(Workflow):
         Write a concise paragraph that introduces this section and ties together the subsections that follow.
         The paragraph should be no more than 3-5 sentences."""
         
-        overview = str(self.llm.complete(prompt))
-        return overview
+        return prompt
 
-    def _generate_placeholder_content(self, report_title, section_title, subsection_title):
-        """Generate placeholder content for missing sections/subsections"""
+    def _placeholder_prompt(self, report_title, section_title, subsection_title):
+        """Build the prompt for placeholder content for missing sections/subsections"""
         if subsection_title:
             prompt = f"""Generate content for the subsection "{subsection_title}" under the section "{section_title}" for a research paper titled "{report_title}".
             
@@ -304,69 +470,123 @@ class ReportGenerationAgent(Workflow):
             
             The content should be informative, well-structured, and around 300-400 words. Provide a comprehensive overview of the topic covered by this section."""
         
-        content = str(self.llm.complete(prompt))
-        return content
+        return prompt
 
-    def generate_section_content(self, queries):
-        """Generate content for each section and subsection in the outline."""
-        self.log("Generating content for sections and subsections")
-        section_contents = {}
-        
-        for section, subsections in queries.items():
-            self.log(f"Generating content for section: {section}")
-            section_contents[section] = {}
+    async def _generate_batch(self, prompts, max_batch_size=5):
+        """Generate short texts for several prompts with one LLM call per batch, keyed like prompts."""
+        async def complete(prompt):
+            # _with_backoff takes the semaphore and retries rate limits and transient errors
+            return await self._with_backoff(lambda: acomplete_once(self.llm, prompt))
+        
+        async def generate(batch):
+            tasks = "\n\n".join(f"Task {i + 1}:\n{prompt}" for i, (_, prompt) in enumerate(batch))
+            prompt = f"""Complete each of the numbered tasks below independently.
+            Respond with only a JSON object mapping each task number (as a string, e.g. "1") to the text written for that task.
             
-            for subsection, data in subsections.items():
-                self.log(f"  Processing subsection: {subsection}")
-                query = data['query']
-                classification = data['classification']
+            {tasks}"""
+            # API errors propagate after retries; only a malformed reply falls back
+            response = await complete(prompt)
+            try:
+                texts = json.loads(JSON_OBJECT_RE.search(response).group(0))
+                return {key: str(texts[str(i + 1)]).strip() for i, (key, _) in enumerate(batch)}
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # Fall back to one call per prompt
+                answers = await asyncio.gather(*(complete(prompt) for _, prompt in batch))
+                return {key: answer for (key, _), answer in zip(batch, answers)}
+        
+        items = list(prompts.items())
+        results = {}
+        for batch_results in await asyncio.gather(*(
+            generate(items[start:start + max_batch_size]) for start in range(0, len(items), max_batch_size)
+        )):
+            results.update(batch_results)
+        return results
+
+    async def _with_backoff(self, make_call, max_retries=3):
+        """Await make_call() under the agent's semaphore, retrying transient errors with backoff."""
+        return await with_backoff(make_call, max_retries, self._semaphore)
+
+    async def _generate_subsection_content(self, section, subsection, query, classification):
+        """Generate content for one subsection."""
+        self.log(f"  Processing subsection: {subsection}")
+        self.log(f"  Query classification: {classification}")
+        self.log(f"  Query: {query}")
+        
+        try:
+            if classification == "LLM":
+                # Fixed instructions first, variable query last, so the prompt prefix is shared
+                expanded_query = f"""Provide a comprehensive response that would be suitable for a subsection of a research paper. 
+                The response should be well-structured, informative, and around 300-500 words.
+                Include relevant facts, concepts, and examples where appropriate.
+                Ensure the content is cohesive and flows well as part of a larger document.
                 
-                self.log(f"  Query classification: {classification}")
-                self.log(f"  Query: {query}")
+                Query: {query}"""
                 
-                try:
-                    if classification == "LLM":
-                        expanded_query = f"""Based on the query: "{query}"
-                        
-                        Provide a comprehensive response that would be suitable for a subsection of a research paper. 
-                        The response should be well-structured, informative, and around 300-500 words.
-                        Include relevant facts, concepts, and examples where appropriate.
-                        Ensure the content is cohesive and flows well as part of a larger document."""
-                        
-                        answer = str(self.llm.complete(expanded_query))
-                    else:
-                        # Add instructions to format the response appropriately
-                        query_with_instructions = f"""Query: {query}
-                        
-                        Please provide a comprehensive response suitable for a research paper subsection.
-                        Include specific details, facts, and references where possible."""
-                        
-                        answer = str(self.query_engine.query(query_with_instructions))
-                    
-                    # Handle potentially empty responses
-                    if not answer or len(answer.strip()) < 50:
-                        self.log(f"  Warning: Short or empty response received")
-                        # Generate fallback content with LLM
-                        fallback_query = f"Provide informative content about {subsection} for a research paper on {section}"
-                        answer = str(self.llm.complete(fallback_query))
-                    
-                    section_contents[section][subsection] = answer
-                    self.log(f"  Content generated: {len(answer)} characters")
-                    
-                except Exception as e:
-                    self.log(f"  Error generating content: {str(e)}")
-                    # Generate fallback content
-                    section_contents[section][subsection] = f"Content could not be generated for this subsection due to an error: {str(e)}"
+                answer = await self._with_backoff(lambda: acomplete_once(self.llm, expanded_query))
+            else:
+                # Add instructions to format the response appropriately
+                query_with_instructions = f"""Query: {query}
+                
+                Please provide a comprehensive response suitable for a research paper subsection.
+                Include specific details, facts, and references where possible."""
+                
+                # Simple lookups skip the reranking pass when a fast engine is available
+                if self.fast_query_engine is not None and is_simple_query(query):
+                    answer = await self._with_backoff(
+                        lambda: cached_aquery(
+                            self.fast_query_engine, query_with_instructions,
+                            engine_name="fast", index_version=self.index_version
+                        )
+                    )
+                else:
+                    answer = await self._with_backoff(lambda: cached_aquery(
+                        self.query_engine, query_with_instructions, index_version=self.index_version
+                    ))
+            
+            # Handle potentially empty responses
+            if not answer or len(answer.strip()) < 50:
+                self.log(f"  Warning: Short or empty response received")
+                # Generate fallback content with LLM
+                fallback_query = f"Provide informative content about {subsection} for a research paper on {section}"
+                answer = await self._with_backoff(lambda: acomplete_once(self.llm, fallback_query))
+            
+            self.log(f"  Content generated: {len(answer)} characters")
+            return answer
+            
+        except Exception as e:
+            self.log(f"  Error generating content: {str(e)}")
+            # Generate fallback content
+            return f"Content could not be generated for this subsection due to an error: {str(e)}"
+
+    async def _generate_section_content(self, section, subsection_queries):
+        """Generate the content of every subsection of one section concurrently."""
+        answers = await asyncio.gather(*(
+            self._generate_subsection_content(section, subsection, item['query'], item['classification'])
+            for subsection, item in subsection_queries.items()
+        ))
+        return dict(zip(subsection_queries, answers))
+
+    async def agenerate_section_content(self, queries):
+        """Generate content for each section and subsection in the outline concurrently."""
+        self.log("Generating content for sections and subsections")
         
-        return section_contents
+        # Concurrency is bounded by the agent's semaphore
+        contents = await asyncio.gather(*(
+            self._generate_section_content(section, subsection_queries)
+            for section, subsection_queries in queries.items()
+        ))
+        return dict(zip(queries, contents))
 
     @step(pass_context=True)
     async def queries_generation_event(self, ctx: Context, ev: StartEvent) -> ReportGenerationEvent:
         """Generate queries for the report."""
         self.log("Starting queries generation event")
         ctx.data["outline"] = ev.outline
-        queries, title = parse_outline_and_generate_queries(self.llm, ctx.data["outline"])
+        # Blocking LLM calls run off the event loop so it stays free for other work
+        queries, title, sections = await asyncio.to_thread(parse_outline_and_generate_queries, self.llm, ctx.data["outline"])
         ctx.data["title"] = title
+        # Keep the parsed structure so formatting does not parse the outline again
+        ctx.data["sections"] = sections
         
         self.log(f"Generated queries for {len(queries)} sections")
         return ReportGenerationEvent(queries=queries)
@@ -380,11 +600,9 @@ class ReportGenerationAgent(Workflow):
         queries = ev.queries
         title = ctx.data.get("title", "Research Paper")
         
-        # Generate contents for all sections
-        section_contents = self.generate_section_content(queries)
-        
-        # Format and compile the final report
-        report = self.format_report(section_contents, title, ctx.data["outline"])
+        # Generate the section contents and compile the final report; overviews, the introduction
+        # and the conclusion start as soon as the content they depend on is ready
+        report = await self.format_report(queries, title, ctx.data["sections"])
         
         self.log("Report generation completed")
         return StopEvent(result={"response": report})
\ No newline at end of file